@@ -1,6 +1,6 @@
 from django.contrib import admin
 from import_export import resources
-from content.models import Video
+from content.models import Rendition, Video
 from import_export.admin import ImportExportModelAdmin
 
 
@@ -8,8 +8,14 @@ class VideoResource(resources.ModelResource):
     class Meta:
         model = Video  
 
+class RenditionInline(admin.TabularInline):
+    model = Rendition
+    extra = 0
+
+
 class VideoAdmin(ImportExportModelAdmin):
     resource_classes = [VideoResource]
+    inlines = [RenditionInline]
 
 
 admin.site.register(Video, VideoAdmin)
\ No newline at end of file
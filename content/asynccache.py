@@ -0,0 +1,61 @@
+import asyncio
+import redis.asyncio
+from django.conf import settings
+from django.core.cache import cache
+
+_clients = {}
+
+
+def get_async_redis():
+    """
+    Return an asyncio Redis client for the default cache server.
+
+    Connection pools of ``redis.asyncio`` belong to the event loop they were
+    created on, so there is one client per running loop. Under an ASGI
+    server that is one pool per worker process. Under WSGI every async view
+    runs in a loop of its own (``async_to_sync``); the client is closed and
+    forgotten when that loop shuts down, see :func:`_close_with_loop`.
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in _clients:
+        client = redis.asyncio.Redis.from_url(settings.CACHES['default']['LOCATION'])
+        # The loop only holds its tasks weakly; keep the closing task alive here
+        _clients[loop] = client, loop.create_task(_close_with_loop(loop, client))
+    return _clients[loop][0]
+
+
+async def _close_with_loop(loop, client):
+    """
+    Task that waits for the end of its loop: ``asyncio.run`` and ASGI
+    servers cancel the tasks that are still pending before they close the
+    loop, and the client is closed then, while the loop still runs.
+    """
+    try:
+        await loop.create_future()
+    finally:
+        _clients.pop(loop, None)
+        await client.aclose()
+
+
+async def cache_aget(key, default=None):
+    """
+    Non-blocking equivalent of ``cache.get(key, default)``.
+
+    Reads the key written by django-redis directly and decodes it with the
+    cache's own serializer, instead of running the sync client in a thread
+    like ``cache.aget`` does.
+    """
+    raw = await get_async_redis().get(cache.make_key(key))
+    if raw is None:
+        return default
+    return cache.client.decode(raw)
+
+
+async def cache_aget_many(keys):
+    """
+    Non-blocking equivalent of ``cache.get_many(keys)``: one MGET.
+    """
+    if not keys:
+        return {}
+    values = await get_async_redis().mget([cache.make_key(key) for key in keys])
+    return {key: cache.client.decode(raw) for key, raw in zip(keys, values) if raw is not None}
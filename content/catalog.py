@@ -0,0 +1,336 @@
+import hashlib
+import logging
+import time
+import uuid
+import django_rq
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.urls import reverse
+from django.utils.http import urlencode
+from .asynccache import cache_aget
+from .compression import compress_variants
+from .fragments import drop_fragment, dumps, fragment_snapshot, get_fragments, join_fragments, load_fragments
+from .pagination import CatalogQuery, paginate_catalog
+from .signing import MEDIA_URL_BUCKET, media_url_bucket
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_LATEST_KEY = 'catalog:latest:{}'
+CATALOG_LOCK_KEY = 'catalog:lock:{}'
+CATALOG_BROWSE_KEY = 'catalog:browse'
+CATALOG_BROWSE_LATEST_KEY = 'catalog:browse:latest'
+CATALOG_CACHE_TIMEOUT = getattr(settings, 'CATALOG_CACHE_TIMEOUT', 60 * 60 * 24 * 7)
+CATALOG_STALE_WHILE_REVALIDATE = getattr(settings, 'CATALOG_STALE_WHILE_REVALIDATE', 60)
+CATALOG_STALE_IF_ERROR = getattr(settings, 'CATALOG_STALE_IF_ERROR', 60 * 60 * 24)
+CATALOG_LOCK_TIMEOUT = getattr(settings, 'CATALOG_LOCK_TIMEOUT', 30)
+CATALOG_LOCK_WAIT = getattr(settings, 'CATALOG_LOCK_WAIT', 5)
+CATALOG_LOCK_POLL = 0.05
+CATALOG_BROWSE_ROW_SIZE = getattr(settings, 'CATALOG_BROWSE_ROW_SIZE', 12)
+
+logger = logging.getLogger(__name__)
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version and the time it was last changed.
+
+    The version is created on first use (or after the cache was flushed).
+
+    :return: Dict with ``version`` (str) and ``modified`` (unix time).
+    :rtype: dict
+    """
+    state = cache.get(CATALOG_VERSION_KEY)
+    if state is None:
+        cache.add(CATALOG_VERSION_KEY, _new_state(), None)
+        state = cache.get(CATALOG_VERSION_KEY)
+    return _with_media_bucket(state)
+
+
+def bump_catalog_version(video_id=None):
+    """
+    Mark the catalog as changed once the current transaction commits and
+    re-render the list in the background.
+
+    :param video_id: The video that changed, if it was a single one. It
+        moves to a new fragment revision and its fragment is rendered right
+        away, so no list request has to render it.
+
+    The version only moves after the commit, so a list rendered for the new
+    version always contains the change. Cached lists are stored under
+    versioned keys, so the old list simply stops being read; nothing has to
+    be deleted.
+    """
+    transaction.on_commit(lambda: _bump(video_id))
+
+
+def catalog_cache_key(version, query=CatalogQuery()):
+    return f'catalog:list:{version}:{_query_hash(query)}'
+
+
+def render_catalog(query=CatalogQuery()):
+    """
+    Serialize one page of the catalog to JSON bytes.
+
+    The ``next`` link is relative, so the cached page does not depend on the
+    host it was requested through. The videos are joined from their cached
+    JSON fragments instead of being serialized again.
+    """
+    from content.models import Video
+    snapshot = fragment_snapshot()
+    videos, cursor = paginate_catalog(Video.objects.prefetch_related('renditions'), query)
+    next_url = f"{reverse('video-list')}?{urlencode(query.params(cursor))}" if cursor else None
+    return b'{"next":' + dumps(next_url) + b',"results":' + join_fragments(get_fragments(videos, snapshot)) + b'}'
+
+
+def get_catalog_payload(query=CatalogQuery()):
+    """
+    Return the JSON of one page of the current catalog version.
+
+    The background refresh normally has it ready. On a miss only the request
+    holding the regeneration lock renders it; everybody else gets the last
+    rendered list while the version changed less than
+    ``CATALOG_STALE_WHILE_REVALIDATE`` seconds ago, or waits for the lock
+    holder otherwise. If rendering fails, the last list is served for up to
+    ``CATALOG_STALE_IF_ERROR`` seconds instead of an error.
+
+    :return: The version the payload belongs to and the JSON, as a mapping
+        of content coding to bytes (see :func:`compress_variants`). The
+        version is older than the current one when a stale list is served.
+    :rtype: tuple
+    """
+    state = get_catalog_version()
+    version = state['version']
+    payload = cache.get(catalog_cache_key(version, query))
+    if payload is not None:
+        return version, payload
+
+    if _acquire_lock(version, query):
+        try:
+            return version, _render_and_store(version, query)
+        except Exception:
+            latest = cache.get(CATALOG_LATEST_KEY.format(_query_hash(query)))
+            if latest is None or time.time() - latest['rendered'] > CATALOG_STALE_IF_ERROR:
+                raise
+            logger.exception('Rendering catalog %s failed, serving %s', version, latest['version'])
+            return latest['version'], latest['payload']
+        finally:
+            _release_lock(version, query)
+
+    latest = cache.get(CATALOG_LATEST_KEY.format(_query_hash(query)))
+    if latest is not None and time.time() - state['modified'] <= CATALOG_STALE_WHILE_REVALIDATE:
+        return latest['version'], latest['payload']
+
+    deadline = time.monotonic() + CATALOG_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(CATALOG_LOCK_POLL)
+        payload = cache.get(catalog_cache_key(version, query))
+        if payload is not None:
+            return version, payload
+    return version, compress_variants(render_catalog(query))
+
+
+def refresh_catalog():
+    """
+    Job that renders the first page of the current catalog version into the
+    cache. Other pages and filters are rendered on their first request.
+
+    Does nothing if the list is already cached or someone else is rendering it.
+    """
+    version = get_catalog_version()['version']
+    refresh_browse(version)
+    if cache.get(catalog_cache_key(version)) is not None or not _acquire_lock(version):
+        return
+    try:
+        _render_and_store(version)
+    finally:
+        _release_lock(version)
+
+
+def render_browse():
+    """
+    Serialize the browse rows: per category the number of videos and the
+    newest ``CATALOG_BROWSE_ROW_SIZE`` of them, categories sorted by name.
+
+    Two queries regardless of the number of categories: one for the counts
+    and one that ranks videos within their category with a window function.
+    """
+    from django.db.models import Count, F, Window
+    from django.db.models.functions import RowNumber
+    from content.models import Video
+    snapshot = fragment_snapshot()
+    counts = dict(Video.objects.order_by().values_list('category').annotate(count=Count('id')))
+    rows = {category: [] for category in sorted(counts)}
+    videos = (Video.objects
+              .annotate(row=Window(RowNumber(), partition_by=F('category'),
+                                   order_by=[F('created_at').desc(), F('id').desc()]))
+              .filter(row__lte=CATALOG_BROWSE_ROW_SIZE)
+              .order_by('category', '-created_at', '-id')
+              .prefetch_related('renditions'))
+    for video in videos:
+        rows[video.category].append(video)
+    return join_fragments([
+        b'{"category":' + dumps(category) + b',"count":' + dumps(counts[category])
+        + b',"videos":' + join_fragments(get_fragments(row, snapshot)) + b'}'
+        for category, row in rows.items()
+    ])
+
+
+def refresh_browse(version=None):
+    """
+    Rebuild the browse rows, a materialized view of the catalog kept in
+    Redis and tagged with the catalog version it was built from.
+
+    :return: The stored rows.
+    :rtype: dict
+    """
+    browse = {'version': version or get_catalog_version()['version'], 'payload': compress_variants(render_browse())}
+    cache.set_many({_browse_key(): browse, CATALOG_BROWSE_LATEST_KEY: browse}, None)
+    return browse
+
+
+def get_browse():
+    """
+    Return the browse rows as last materialized.
+
+    They are rebuilt by :func:`refresh_catalog` after every change, so
+    reading them is a single cache lookup. They miss after a cache flush
+    and, with signed media URLs, at every ``MEDIA_URL_BUCKET`` rollover;
+    then only the request holding the lock rebuilds them, like
+    :func:`get_catalog_payload` does for pages. Everybody else gets the last
+    rows for up to ``CATALOG_STALE_WHILE_REVALIDATE`` seconds (their URLs
+    stay valid for ``MEDIA_URL_TTL`` past the rollover) or waits for the
+    lock holder.
+
+    :return: Dict with the ``version`` the rows were built from and the
+        JSON ``payload`` per content coding.
+    :rtype: dict
+    """
+    browse = cache.get(_browse_key())
+    if browse is not None:
+        return browse
+
+    lock = browse_lock_key()
+    if cache.add(lock, 1, CATALOG_LOCK_TIMEOUT):
+        try:
+            return refresh_browse()
+        finally:
+            cache.delete(lock)
+
+    latest = cache.get(CATALOG_BROWSE_LATEST_KEY)
+    if latest is not None and time.time() - get_catalog_version()['modified'] <= CATALOG_STALE_WHILE_REVALIDATE:
+        return latest
+
+    deadline = time.monotonic() + CATALOG_LOCK_WAIT
+    while time.monotonic() < deadline:
+        time.sleep(CATALOG_LOCK_POLL)
+        browse = cache.get(_browse_key())
+        if browse is not None:
+            return browse
+    return refresh_browse()
+
+
+async def aget_catalog_version():
+    """
+    Async :func:`get_catalog_version`; reads Redis without blocking the loop.
+    """
+    state = await cache_aget(CATALOG_VERSION_KEY)
+    if state is None:
+        return await sync_to_async(get_catalog_version)()
+    return _with_media_bucket(state)
+
+
+async def aget_catalog_payload(query=CatalogQuery()):
+    """
+    Async :func:`get_catalog_payload`.
+
+    A cached page costs two non-blocking Redis reads. Only a miss, which
+    has to render the page with the ORM, runs the sync path in a thread.
+    """
+    version = (await aget_catalog_version())['version']
+    payload = await cache_aget(catalog_cache_key(version, query))
+    if payload is not None:
+        return version, payload
+    return await sync_to_async(get_catalog_payload)(query)
+
+
+async def aget_browse():
+    """
+    Async :func:`get_browse`.
+    """
+    return await cache_aget(_browse_key()) or await sync_to_async(get_browse)()
+
+
+def _render_and_store(version, query=CatalogQuery()):
+    """
+    Render a page and store it under its version and as the latest copy of
+    that page, which is what readers fall back to while the next version is
+    rendered. The page is stored pre-compressed, so responses never
+    compress it again.
+    """
+    payload = compress_variants(render_catalog(query))
+    cache.set_many({
+        catalog_cache_key(version, query): payload,
+        CATALOG_LATEST_KEY.format(_query_hash(query)): {'version': version, 'payload': payload,
+                                                        'rendered': time.time()},
+    }, CATALOG_CACHE_TIMEOUT)
+    return payload
+
+
+def _acquire_lock(version, query=CatalogQuery()):
+    return cache.add(catalog_lock_key(version, query), 1, CATALOG_LOCK_TIMEOUT)
+
+
+def _release_lock(version, query=CatalogQuery()):
+    cache.delete(catalog_lock_key(version, query))
+
+
+def catalog_lock_key(version, query=CatalogQuery()):
+    return CATALOG_LOCK_KEY.format(f'{version}:{_query_hash(query)}')
+
+
+def browse_lock_key():
+    return f'{_browse_key()}:lock'
+
+
+def _query_hash(query):
+    return hashlib.md5(query.key.encode()).hexdigest()[:12]
+
+
+def _bump(video_id=None):
+    if video_id is not None:
+        drop_fragment(video_id)
+        load_fragments([video_id])
+    cache.set(CATALOG_VERSION_KEY, _new_state(), None)
+    queue = django_rq.get_queue('default', autocommit=True)
+    queue.enqueue(refresh_catalog, job_id='catalog-refresh')
+
+
+def catalog_version_etag(request, version):
+    """
+    Strong ETag of a catalog response: the catalog version plus the query
+    string, since every page or filter is a different representation.
+    """
+    query = hashlib.md5(request.META.get('QUERY_STRING', '').encode()).hexdigest()[:8]
+    return f'{version}-{query}'
+
+
+def _with_media_bucket(state):
+    """
+    Cached pages contain signed media URLs that expire, so with signing on
+    the effective version also changes with every ``MEDIA_URL_BUCKET``.
+    """
+    bucket = media_url_bucket()
+    if bucket is None:
+        return state
+    return {'version': f"{state['version']}.{bucket}",
+            'modified': max(state['modified'], bucket * MEDIA_URL_BUCKET)}
+
+
+def _browse_key():
+    bucket = media_url_bucket()
+    return CATALOG_BROWSE_KEY if bucket is None else f'{CATALOG_BROWSE_KEY}:{bucket}'
+
+
+def _new_state():
+    return {'version': uuid.uuid4().hex, 'modified': int(time.time())}
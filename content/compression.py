@@ -0,0 +1,60 @@
+import gzip
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Content codings in order of preference, best compression first
+PREFERENCE = ('br', 'gzip', 'identity')
+# Codings payloads are stored in
+ENCODINGS = PREFERENCE if brotli is not None else ('gzip', 'identity')
+ETAG_SUFFIXES = {'br': '-br', 'gzip': '-gz', 'identity': ''}
+
+
+def compress_variants(payload):
+    """
+    Compress a payload once in every supported encoding.
+
+    Cached payloads are compressed at the highest level, since the cost is
+    paid once per catalog version instead of once per response.
+
+    :param payload: The uncompressed bytes.
+    :return: Mapping of every coding in ``ENCODINGS`` to bytes.
+    :rtype: dict
+    """
+    variants = {'identity': payload, 'gzip': gzip.compress(payload, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(payload, quality=11)
+    return variants
+
+
+def choose_encoding(accept_encoding, available):
+    """
+    Pick the best available content coding the client accepts.
+
+    :param accept_encoding: Value of the ``Accept-Encoding`` header.
+    :type accept_encoding: str
+    :param available: Codings the payload is stored in.
+    :return: ``br``, ``gzip`` or ``identity``.
+    :rtype: str
+    """
+    weights = {}
+    for part in accept_encoding.split(','):
+        coding, _, params = part.strip().lower().partition(';')
+        weight = 1.0
+        name, _, value = params.strip().partition('=')
+        if name.strip() == 'q':
+            try:
+                weight = float(value)
+            except ValueError:
+                weight = 0.0
+        if coding:
+            weights[coding.strip()] = weight
+    for encoding in PREFERENCE:
+        if encoding not in available:
+            continue
+        default = 1.0 if encoding == 'identity' else weights.get('*', 0.0)
+        if weights.get(encoding, default) > 0:
+            return encoding
+    return 'identity'
@@ -0,0 +1,165 @@
+import json
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.db import models
+from .asynccache import cache_aget_many
+from .models import Video
+from .signing import media_url_bucket
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+FRAGMENT_KEY = 'catalog:video:{}:{}'
+FRAGMENT_REVISION_KEY = 'catalog:video:{}:revision'
+# Counts fragment changes; a video's revision is the count of its last change
+FRAGMENT_SEQUENCE_KEY = 'catalog:fragments:sequence'
+FRAGMENT_TIMEOUT = 60 * 60 * 24 * 7
+
+
+def dumps(data):
+    """
+    Encode ``data`` to compact JSON bytes, with orjson if it is installed.
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False).encode()
+
+
+def video_data(video):
+    """
+    Read-only equivalent of ``VideoSerializer(video).data``.
+
+    Reads the concrete model fields directly instead of going through DRF
+    field introspection, leaving out ``Video.UNCACHED_FIELDS``. Files are
+    rendered as their URL or ``None``, like DRF does without a request;
+    ``renditions`` must be prefetched.
+    """
+    data = {}
+    for field in video._meta.concrete_fields:
+        if field.name in Video.UNCACHED_FIELDS:
+            continue
+        value = getattr(video, field.attname)
+        if isinstance(field, models.FileField):
+            value = value.url if value else None
+        elif isinstance(field, models.DateField) and value is not None:
+            value = value.isoformat()
+        data[field.name] = value
+        if field.primary_key:
+            data['renditions'] = [
+                {'profile': rendition.profile, 'file': rendition.file.url if rendition.file else None}
+                for rendition in video.renditions.all()
+            ]
+    return data
+
+
+def fragment_snapshot():
+    """
+    Return the current fragment sequence number. Take it before the videos
+    are read from the database and pass it to :func:`get_fragments`.
+    """
+    return cache.get(FRAGMENT_SEQUENCE_KEY, 0)
+
+
+def get_fragments(videos, snapshot):
+    """
+    Return the JSON fragment of every video, in order.
+
+    Fragments are kept in the cache per video and revision and only
+    rendered for videos that changed since (see :func:`drop_fragment`), so a
+    page is mostly built from two ``get_many`` and a byte join.
+
+    A fragment is only stored if the video's revision is not newer than
+    ``snapshot``. Otherwise the video changed after the snapshot, the row may
+    have been read before the change, and the rendered fragment may be
+    stale; it is still returned but left for the next render.
+
+    :param videos: Videos with ``renditions`` prefetched.
+    :param snapshot: :func:`fragment_snapshot` from before the videos were read.
+    :return: JSON bytes per video.
+    :rtype: list
+    """
+    revisions = get_revisions([video.pk for video in videos])
+    keys = [fragment_key(video.pk, revisions[video.pk]) for video in videos]
+    fragments = cache.get_many(keys)
+    missing = {key: dumps(video_data(video)) for key, video in zip(keys, videos) if key not in fragments}
+    if missing:
+        fresh = {fragment_key(video.pk, revisions[video.pk]) for video in videos if revisions[video.pk] <= snapshot}
+        cache.set_many({key: fragment for key, fragment in missing.items() if key in fresh}, FRAGMENT_TIMEOUT)
+        fragments.update(missing)
+    return [fragments[key] for key in keys]
+
+
+def load_fragments(video_ids):
+    """
+    Render and cache the fragments of videos by id, in one query plus the
+    renditions prefetch. Ids of videos that no longer exist are skipped.
+
+    :return: Mapping of video id to JSON bytes.
+    :rtype: dict
+    """
+    snapshot = fragment_snapshot()
+    videos = list(Video.objects.filter(id__in=video_ids).prefetch_related('renditions'))
+    return dict(zip([video.pk for video in videos], get_fragments(videos, snapshot)))
+
+
+async def aget_fragments_by_id(video_ids):
+    """
+    Return the fragments of videos by id, in order, with two MGETs: the
+    revisions, then the fragments. Only fragments missing from the cache are
+    loaded, with :func:`load_fragments`.
+
+    :return: Mapping of video id to JSON bytes, in the order of
+        ``video_ids``; videos that no longer exist are left out.
+    :rtype: dict
+    """
+    revisions = await cache_aget_many([revision_key(video_id) for video_id in video_ids])
+    keys = [fragment_key(video_id, revisions.get(revision_key(video_id), 0)) for video_id in video_ids]
+    cached = await cache_aget_many(keys)
+    fragments = {video_id: cached[key] for video_id, key in zip(video_ids, keys) if key in cached}
+    missing = [video_id for video_id in video_ids if video_id not in fragments]
+    if missing:
+        fragments.update(await sync_to_async(load_fragments)(missing))
+    return {video_id: fragments[video_id] for video_id in video_ids if video_id in fragments}
+
+
+def join_fragments(fragments):
+    """
+    Join JSON fragments into a JSON array without decoding them.
+    """
+    return b'[' + b','.join(fragments) + b']'
+
+
+def fragment_key(video_id, revision):
+    """
+    Cache key of a fragment. Fragments hold signed media URLs when signing
+    is on, so they are kept per expiry bucket.
+    """
+    key = FRAGMENT_KEY.format(video_id, revision)
+    bucket = media_url_bucket()
+    return key if bucket is None else f'{key}:{bucket}'
+
+
+def revision_key(video_id):
+    return FRAGMENT_REVISION_KEY.format(video_id)
+
+
+def get_revisions(video_ids):
+    """
+    Return the fragment revision of every video; 0 for videos that never changed.
+
+    :rtype: dict
+    """
+    revisions = cache.get_many([revision_key(video_id) for video_id in video_ids])
+    return {video_id: revisions.get(revision_key(video_id), 0) for video_id in video_ids}
+
+
+def drop_fragment(video_id):
+    """
+    Move the video to a new revision, so its cached fragment is no longer
+    read. Nothing is deleted: a render still in flight writes its stale
+    fragment under the old revision, where nobody looks for it.
+    """
+    cache.add(FRAGMENT_SEQUENCE_KEY, 0, None)
+    cache.set(revision_key(video_id), cache.incr(FRAGMENT_SEQUENCE_KEY), None)
@@ -0,0 +1,64 @@
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+from content.fragments import dumps, join_fragments, orjson, video_data
+from content.models import Rendition, Video
+from content.serializers import VideoSerializer
+
+
+class Command(BaseCommand):
+    help = ('Compares rendering a catalog page with VideoSerializer against the JSON fragment path. '
+            'The rows are created in a transaction that is rolled back afterwards.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10_000, help='Number of videos to render (default: 10000)')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per variant, the best is reported')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.create_rows(options['rows'])
+            videos = list(Video.objects.prefetch_related('renditions').order_by('-created_at', '-id'))
+            fragments = [dumps(video_data(video)) for video in videos]
+            variants = {
+                'VideoSerializer + JSONRenderer': lambda: JSONRenderer().render(VideoSerializer(videos, many=True).data),
+                'fragments, rendered': lambda: join_fragments([dumps(video_data(video)) for video in videos]),
+                'fragments, precomputed': lambda: join_fragments(fragments),
+            }
+            self.stdout.write(f"{len(videos)} videos, encoder: {'orjson' if orjson else 'json'}")
+            self.stdout.write(f"{'variant':<32}{'ms':>10}{'rows/s':>12}{'size (KB)':>12}")
+            for name, render in variants.items():
+                seconds, size = self.benchmark(render, options['repeat'])
+                self.stdout.write(f"{name:<32}{seconds * 1000:>10.1f}{len(videos) / seconds:>12.0f}{size / 1000:>12.1f}")
+            transaction.set_rollback(True)
+
+    def create_rows(self, rows):
+        """
+        Bulk create videos with two renditions each, bypassing the save signals.
+        """
+        today = date.today()
+        videos = Video.objects.bulk_create(
+            Video(title=f'Benchmark {i}', description='Benchmark video ' * 10, category=f'Category {i % 8}',
+                  created_at=today - timedelta(days=i % 365), video_file=f'videos/benchmark_{i}.mp4',
+                  video_480p=f'videos/480p/benchmark_{i}_480p.mp4', video_720p=f'videos/720p/benchmark_{i}_720p.mp4',
+                  status=Video.Status.READY)
+            for i in range(rows)
+        )
+        Rendition.objects.bulk_create(
+            Rendition(video=video, profile=profile, file=f'videos/{profile}/benchmark_{video.pk}_{profile}.mp4')
+            for video in videos for profile in ('480p', '720p')
+        )
+
+    def benchmark(self, render, repeat):
+        """
+        :return: Best wall-clock seconds of ``repeat`` runs and the output size in bytes.
+        :rtype: tuple
+        """
+        best, size = None, 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            size = len(render())
+            seconds = time.perf_counter() - started
+            best = seconds if best is None else min(best, seconds)
+        return best, size
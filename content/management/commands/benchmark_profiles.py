@@ -0,0 +1,49 @@
+import os
+import subprocess
+import tempfile
+import time
+from django.core.management.base import BaseCommand, CommandError
+from content.profiles import PROFILES
+from content.progress import parse_progress
+from content.tasks import FFMPEG_BIN
+
+
+class Command(BaseCommand):
+    help = 'Encodes a reference clip with every encoding profile and reports encode fps and output size'
+
+    def add_arguments(self, parser):
+        parser.add_argument('clip', help='Path of the reference clip')
+        parser.add_argument('--profiles', nargs='+', default=list(PROFILES),
+                            help='Profile names to benchmark (default: all registered)')
+
+    def handle(self, *args, **options):
+        clip = options['clip']
+        if not os.path.isfile(clip):
+            raise CommandError(f'Reference clip not found: {clip}')
+        unknown = set(options['profiles']) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profiles: {', '.join(sorted(unknown))}")
+
+        self.stdout.write(f"{'profile':<10}{'frames':>8}{'seconds':>10}{'fps':>10}{'size (MB)':>12}")
+        with tempfile.TemporaryDirectory() as work_dir:
+            for name in options['profiles']:
+                frames, seconds, size = self.benchmark(clip, PROFILES[name], work_dir)
+                fps = frames / seconds if seconds else 0
+                self.stdout.write(f"{name:<10}{frames:>8}{seconds:>10.2f}{fps:>10.1f}{size / 1_000_000:>12.2f}")
+
+    def benchmark(self, clip, profile, work_dir):
+        """
+        Encode the clip once with the profile.
+
+        :return: Encoded frames, wall-clock seconds and output size in bytes.
+        :rtype: tuple
+        """
+        target = os.path.join(work_dir, f'{profile.name}.mp4')
+        cmd = [FFMPEG_BIN, '-y', '-progress', 'pipe:1', '-nostats', '-i', clip,
+               *profile.video_args(), target]
+        started = time.perf_counter()
+        result = subprocess.run(cmd, check=True, capture_output=True, text=True)
+        seconds = time.perf_counter() - started
+        reports = list(parse_progress(result.stdout.splitlines()))
+        frames = int(reports[-1].get('frame', 0)) if reports else 0
+        return frames, seconds, os.path.getsize(target)
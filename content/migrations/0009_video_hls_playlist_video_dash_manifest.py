@@ -0,0 +1,23 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0008_video_video_480p_video_video_720p'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='dash_manifest',
+            field=models.FileField(blank=True, null=True, upload_to='videos/streams'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='hls_playlist',
+            field=models.FileField(blank=True, null=True, upload_to='videos/streams'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:48
+
+from django.db import migrations, models
+
+from content.uploadhandlers import file_sha256
+
+
+def hash_existing_videos(apps, schema_editor):
+    Video = apps.get_model('content', 'Video')
+    for video in Video.objects.exclude(video_file=''):
+        try:
+            with video.video_file.open('rb') as f:
+                content_hash = file_sha256(f)
+        except FileNotFoundError:
+            continue
+        Video.objects.filter(id=video.id).update(content_hash=content_hash)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0009_video_hls_playlist_video_dash_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.RunPython(hash_existing_videos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_renditions(apps, schema_editor):
+    Video = apps.get_model('content', 'Video')
+    Rendition = apps.get_model('content', 'Rendition')
+    renditions = []
+    for video in Video.objects.all():
+        for profile, field in (('480p', 'video_480p'), ('720p', 'video_720p')):
+            name = getattr(video, field).name
+            if name:
+                renditions.append(Rendition(video=video, profile=profile, file=name))
+    Rendition.objects.bulk_create(renditions)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0010_video_content_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Rendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('profile', models.CharField(max_length=20)),
+                ('file', models.FileField(upload_to='videos/renditions')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('video', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='content.video')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='rendition',
+            constraint=models.UniqueConstraint(fields=('video', 'profile'), name='unique_rendition_per_profile'),
+        ),
+        migrations.RunPython(backfill_renditions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0012_uploadsession'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='poster',
+            field=models.FileField(blank=True, null=True, upload_to='videos/images'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='sprite',
+            field=models.FileField(blank=True, null=True, upload_to='videos/images'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='sprite_vtt',
+            field=models.FileField(blank=True, null=True, upload_to='videos/images'),
+        ),
+        migrations.AddField(
+            model_name='video',
+            name='thumbnail',
+            field=models.FileField(blank=True, null=True, upload_to='videos/images'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.7 on 2026-10-18 20:52
+
+from django.db import migrations, models
+
+
+def mark_converted_videos_ready(apps, schema_editor):
+    Video = apps.get_model('content', 'Video')
+    Video.objects.exclude(video_480p='').exclude(video_480p__isnull=True).update(status='ready')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0013_video_artwork'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('encoding', 'Encoding'), ('ready', 'Ready'), ('failed', 'Failed')], default='pending', max_length=10),
+        ),
+        migrations.RunPython(mark_converted_videos_ready, migrations.RunPython.noop),
+    ]
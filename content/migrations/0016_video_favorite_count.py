@@ -0,0 +1,29 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:10
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_favorites(apps, schema_editor):
+    Video = apps.get_model('content', 'Video')
+    Favorite = apps.get_model('users', 'CustomUser').favorite_videos.through
+    counts = Favorite.objects.values('video_id').annotate(count=Count('*')).values_list('video_id', 'count')
+    for video_id, count in counts:
+        Video.objects.filter(id=video_id).update(favorite_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0015_video_catalog_indexes'),
+        ('users', '0002_customuser_favorite_videos'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='favorite_count',
+            field=models.PositiveIntegerField(db_index=True, default=0),
+        ),
+        migrations.RunPython(count_favorites, migrations.RunPython.noop),
+    ]
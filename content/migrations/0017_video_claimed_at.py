@@ -0,0 +1,18 @@
+# Generated by Django 5.0.7 on 2026-10-18 21:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('content', '0016_video_favorite_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='video',
+            name='claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
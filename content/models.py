@@ -1,16 +1,102 @@
+import os
+import uuid
+from django.conf import settings
 from django.db import models
 from datetime import date
 # Create your models here.
 
 class Video(models.Model):
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pending'
+        ENCODING = 'encoding', 'Encoding'
+        READY = 'ready', 'Ready'
+        FAILED = 'failed', 'Failed'
+
     created_at = models.DateField(default=date.today)
     title = models.CharField(max_length=80)
     description = models.CharField(max_length=500)
     video_file = models.FileField(upload_to='videos', blank=True, null=True)
     category = models.CharField(max_length=40)
+    content_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING)
+    # When the encoding job last claimed or renewed the video; an older claim has expired
+    claimed_at = models.DateTimeField(blank=True, null=True)
 
     video_480p = models.FileField(upload_to='videos/480p', blank=True, null=True)
     video_720p = models.FileField(upload_to='videos/720p', blank=True, null=True)
 
+    hls_playlist = models.FileField(upload_to='videos/streams', blank=True, null=True)
+    dash_manifest = models.FileField(upload_to='videos/streams', blank=True, null=True)
+
+    poster = models.FileField(upload_to='videos/images', blank=True, null=True)
+    thumbnail = models.FileField(upload_to='videos/images', blank=True, null=True)
+    sprite = models.FileField(upload_to='videos/images', blank=True, null=True)
+    sprite_vtt = models.FileField(upload_to='videos/images', blank=True, null=True)
+
+    # Maintained incrementally by users.favorites, reconciled periodically
+    favorite_count = models.PositiveIntegerField(default=0, db_index=True)
+
+    # Profiles that are also stored in a column of their own
+    RENDITION_FIELDS = {
+        '480p': 'video_480p',
+        '720p': 'video_720p',
+    }
+
+    # Fields that change too often to be part of the cached catalog, or are internal to the workers
+    UNCACHED_FIELDS = ('favorite_count', 'claimed_at')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id'], name='video_created_idx'),
+            models.Index(fields=['category', '-created_at', '-id'], name='video_category_created_idx'),
+        ]
+
     def __str__(self) :
-        return  self.title
\ No newline at end of file
+        return  self.title
+
+
+class Rendition(models.Model):
+    """
+    One encoded version of a video, produced with a named encoding profile
+    from ``content.profiles``.
+    """
+    video = models.ForeignKey(Video, on_delete=models.CASCADE, related_name='renditions')
+    profile = models.CharField(max_length=20)
+    file = models.FileField(upload_to='videos/renditions')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['video', 'profile'], name='unique_rendition_per_profile'),
+        ]
+
+    def __str__(self):
+        return f"{self.video} ({self.profile})"
+
+
+class UploadSession(models.Model):
+    """
+    A resumable upload in progress. The bytes received so far are kept in a
+    partial file under ``MEDIA_ROOT/uploads``; the video is created once
+    ``offset`` reaches ``length``.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    filename = models.CharField(max_length=255)
+    length = models.BigIntegerField()
+    offset = models.BigIntegerField(default=0)
+    title = models.CharField(max_length=80)
+    description = models.CharField(max_length=500, blank=True, default='')
+    category = models.CharField(max_length=40, blank=True, default='')
+    video = models.ForeignKey(Video, on_delete=models.SET_NULL, blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def partial_path(self):
+        return os.path.join(settings.MEDIA_ROOT, 'uploads', f'{self.id}.part')
+
+    @property
+    def is_complete(self):
+        return self.offset >= self.length
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.length})"
@@ -0,0 +1,110 @@
+import base64
+import binascii
+from collections import namedtuple
+from datetime import date
+from django.conf import settings
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+CATALOG_PAGE_SIZE = getattr(settings, 'CATALOG_PAGE_SIZE', 24)
+CATALOG_MAX_PAGE_SIZE = getattr(settings, 'CATALOG_MAX_PAGE_SIZE', 100)
+
+# Newest first; ``id`` breaks ties between videos created on the same day
+CATALOG_ORDERING = ('-created_at', '-id')
+
+
+class CatalogQuery(namedtuple('CatalogQuery', ['category', 'cursor', 'page_size'])):
+    """
+    One page of the catalog, as requested by ``?category=&cursor=&page_size=``.
+    """
+    __slots__ = ()
+
+    def __new__(cls, category='', cursor='', page_size=CATALOG_PAGE_SIZE):
+        return super().__new__(cls, category, cursor, page_size)
+
+    @property
+    def key(self):
+        """
+        Normalized form of the query, used in cache keys.
+        """
+        return f'{self.category}|{self.cursor}|{self.page_size}'
+
+    def params(self, cursor):
+        """
+        Query parameters of the page that starts at ``cursor``.
+        """
+        params = {'cursor': cursor}
+        if self.category:
+            params['category'] = self.category
+        if self.page_size != CATALOG_PAGE_SIZE:
+            params['page_size'] = self.page_size
+        return params
+
+
+def parse_catalog_query(params):
+    """
+    Validate the query parameters of a catalog request.
+
+    :param params: ``request.query_params`` or any mapping.
+    :return: The normalized query.
+    :rtype: CatalogQuery
+    :raises ValidationError: If the cursor or page size is invalid.
+    """
+    cursor = params.get('cursor', '')
+    if cursor:
+        decode_cursor(cursor)
+    page_size = params.get('page_size', CATALOG_PAGE_SIZE)
+    try:
+        page_size = int(page_size)
+    except (TypeError, ValueError):
+        raise ValidationError({'page_size': 'Must be an integer.'})
+    if not 1 <= page_size <= CATALOG_MAX_PAGE_SIZE:
+        raise ValidationError({'page_size': f'Must be between 1 and {CATALOG_MAX_PAGE_SIZE}.'})
+    return CatalogQuery(params.get('category', '').strip(), cursor, page_size)
+
+
+def encode_cursor(video):
+    """
+    Opaque cursor pointing just behind ``video`` in catalog order.
+    """
+    return base64.urlsafe_b64encode(f'{video.created_at.isoformat()}:{video.id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    :return: ``created_at`` and ``id`` of the last video of the previous page.
+    :rtype: tuple
+    :raises ValidationError: If the cursor was not produced by :func:`encode_cursor`.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, video_id = raw.split(':')
+        return date.fromisoformat(created_at), int(video_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValidationError({'cursor': 'Invalid cursor.'})
+
+
+def paginate_catalog(queryset, query):
+    """
+    Return one page of ``queryset`` using keyset pagination.
+
+    Instead of an ``OFFSET``, the page continues strictly after the
+    ``(created_at, id)`` of the previous page's last video, so every page is
+    a range scan on the ``(created_at, id)`` and ``(category, created_at, id)``
+    indexes and costs the same no matter how deep into the catalog it is.
+
+    :return: The videos of the page and the cursor of the next page, or
+        ``None`` on the last page.
+    :rtype: tuple
+    """
+    queryset = queryset.order_by(*CATALOG_ORDERING)
+    if query.category:
+        queryset = queryset.filter(category=query.category)
+    if query.cursor:
+        created_at, video_id = decode_cursor(query.cursor)
+        queryset = queryset.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=video_id))
+    videos = list(queryset[:query.page_size + 1])
+    if len(videos) > query.page_size:
+        videos = videos[:query.page_size]
+        return videos, encode_cursor(videos[-1])
+    return videos, None
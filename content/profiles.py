@@ -0,0 +1,69 @@
+from dataclasses import dataclass
+from django.conf import settings
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """
+    Encoder settings for one rendition.
+
+    ``size`` is anything ffmpeg accepts as frame size (``hd480``, ``640x360``).
+    Quality is set either by ``crf`` or, if given, a target ``bitrate``.
+    """
+    name: str
+    size: str
+    codec: str = 'libx264'
+    crf: int = 23
+    bitrate: str = None
+    preset: str = 'medium'
+    audio_codec: str = 'aac'
+
+    def video_args(self):
+        """
+        Return the ffmpeg arguments that encode one output with this profile.
+        """
+        return ['-s', self.size, *self.encoder_args(), '-c:a', self.audio_codec]
+
+    def encoder_args(self, stream=None):
+        """
+        Return the video encoder arguments, optionally bound to the output
+        video stream with the given index.
+        """
+        video = 'v' if stream is None else f'v:{stream}'
+        spec = '' if stream is None else f':{video}'
+        args = [f'-c:{video}', self.codec, f'-preset{spec}', self.preset]
+        if self.bitrate:
+            return args + [f'-b:{video}', self.bitrate]
+        return args + [f'-crf{spec}', str(self.crf)]
+
+
+PROFILES = {}
+
+
+def register_profile(profile):
+    """
+    Add an encoding profile to the registry, replacing one with the same name.
+    """
+    PROFILES[profile.name] = profile
+    return profile
+
+
+def get_profile(name):
+    return PROFILES[name]
+
+
+def active_profiles():
+    """
+    Return the profiles new uploads are encoded with, in ``VIDEO_PROFILES`` order.
+
+    :return: Mapping of profile name to profile.
+    :rtype: dict
+    """
+    names = getattr(settings, 'VIDEO_PROFILES', ['480p', '720p'])
+    return {name: PROFILES[name] for name in names}
+
+
+register_profile(EncodingProfile('360p', '640x360', crf=26, preset='fast'))
+register_profile(EncodingProfile('480p', 'hd480'))
+register_profile(EncodingProfile('720p', 'hd720'))
+register_profile(EncodingProfile('1080p', 'hd1080', preset='slow'))
@@ -0,0 +1,91 @@
+import json
+from django_redis import get_redis_connection
+
+PROGRESS_KEY = 'videoflix:transcode:progress:{}'
+PROGRESS_TTL = 60 * 60 * 24
+
+
+def parse_progress(lines):
+    """
+    Group the ``key=value`` lines of ``ffmpeg -progress`` into reports.
+
+    ffmpeg writes one block per update and closes it with a ``progress`` line
+    (``continue`` or ``end``).
+
+    :param lines: Iterable of text lines from the progress pipe.
+    :return: Generator of dicts, one per block.
+    """
+    report = {}
+    for line in lines:
+        key, sep, value = line.strip().partition('=')
+        if not sep:
+            continue
+        report[key] = value
+        if key == 'progress':
+            yield report
+            report = {}
+
+
+def summarize(report, duration=None):
+    """
+    Turn a raw ffmpeg progress block into frames, fps, speed and ETA.
+
+    :param report: One block from :func:`parse_progress`.
+    :type report: dict
+    :param duration: Duration of the input in seconds, if known.
+    :type duration: float
+    :return: The summary that is published.
+    :rtype: dict
+    """
+    out_time = _number(report.get('out_time_us'), int)
+    if out_time is None:
+        out_time = _number(report.get('out_time_ms'), int)
+    out_time = out_time / 1_000_000 if out_time is not None else None
+    speed = _number(report.get('speed', '').rstrip('x'), float)
+    summary = {
+        'frame': _number(report.get('frame'), int) or 0,
+        'fps': _number(report.get('fps'), float) or 0.0,
+        'speed': speed,
+        'out_time': round(out_time, 2) if out_time is not None else None,
+        'percent': None,
+        'eta': None,
+        'status': 'done' if report.get('progress') == 'end' else 'running',
+    }
+    if duration and out_time is not None:
+        summary['percent'] = min(round(out_time / duration * 100, 1), 100.0)
+        if speed:
+            summary['eta'] = round(max(duration - out_time, 0) / speed, 1)
+    if summary['status'] == 'done':
+        summary['percent'], summary['eta'] = 100.0, 0
+    return summary
+
+
+def _number(value, cast):
+    """
+    Parse a numeric progress value; ``N/A`` and other non-numeric values,
+    which ffmpeg reports in early blocks, are unknown (``None``).
+    """
+    try:
+        return cast(value.strip())
+    except (AttributeError, ValueError):
+        return None
+
+
+def publish_progress(video_id, label, summary):
+    """
+    Store the latest progress of one ffmpeg run of a video in Redis.
+    """
+    key = PROGRESS_KEY.format(video_id)
+    connection = get_redis_connection('default')
+    pipe = connection.pipeline()
+    pipe.hset(key, label, json.dumps(summary))
+    pipe.expire(key, PROGRESS_TTL)
+    pipe.execute()
+
+
+def get_progress(video_id):
+    """
+    Return the progress of all runs of a video, keyed by run label.
+    """
+    raw = get_redis_connection('default').hgetall(PROGRESS_KEY.format(video_id))
+    return {label.decode(): json.loads(value) for label, value in raw.items()}
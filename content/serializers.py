@@ -1,7 +1,14 @@
 from rest_framework import serializers
-from .models import Video
+from .models import Rendition, Video
+
+class RenditionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Rendition
+        fields = ('profile', 'file')
 
 class VideoSerializer(serializers.ModelSerializer):
+    renditions = RenditionSerializer(many=True, read_only=True)
+
     class Meta:
         model = Video
-        fields = '__all__'
\ No newline at end of file
+        exclude = Video.UNCACHED_FIELDS
\ No newline at end of file
@@ -1,25 +1,77 @@
 import os
+import shutil
 from django.dispatch import receiver
-from content.models import Video
-from django.db.models.signals import post_save, post_delete
-from content.tasks import convert_480p, convert_720p
+from content.models import Rendition, Video
+from django.db.models.signals import pre_save, post_save, post_delete
+from content.tasks import (REUSED_FIELDS, artwork_dir, mark_failed, share_output, transcode_job_id, transcode_video,
+                           streaming_dir)
 import django_rq
-from django.core.files import File
+from django.db import transaction
+from django.conf import settings
+from content.uploadhandlers import file_sha256
+from content.catalog import bump_catalog_version
+
+
+@receiver(pre_save, sender=Video)
+def video_pre_save(sender, instance, **kwargs):
+    """
+    Signal handler that is triggered before a Video object is saved.
+    Hashes a newly uploaded file and, if the same content was uploaded before,
+    points the video at the existing source and renditions instead of
+    storing the file again. A duplicate of a video that is still pending or
+    encoding waits for it instead of being encoded again. New videos whose
+    file is already stored can pass a precomputed ``content_hash`` instead.
+    """
+    video_file = instance.video_file
+    if video_file and not video_file._committed:
+        instance.content_hash = getattr(video_file.file, 'content_hash', None) or file_sha256(video_file)
+    elif not (instance._state.adding and instance.content_hash):
+        return
+
+    original = (Video.objects.filter(content_hash=instance.content_hash)
+                .exclude(pk=instance.pk).exclude(video_file='').first())
+    if original:
+        instance.video_file = original.video_file.name
+        for field in REUSED_FIELDS:
+            setattr(instance, field, getattr(original, field).name)
+        if original.status == Video.Status.READY:
+            instance.status = Video.Status.READY
+        elif original.status != Video.Status.FAILED:
+            instance._waits_for = original
+        instance._duplicate_of = original
+
 
 @receiver(post_save, sender=Video)
 def video_post_save(sender, instance, created, **kwargs):
     """
       Signal handler that is triggered after a Video object is saved.
-      When a new video is created, this function enqueues tasks for video conversion 
-      to the default queue.
+      When a new pending video is created, this function enqueues a single job
+      that converts the video into all renditions on the default queue once the
+      transaction commits. Long videos are fanned out into chunk jobs from
+      there. Duplicate uploads of a ready video are ready already and are not
+      converted again; duplicates of a video that is still encoding get its
+      output once it is ready (``share_output``). Every save bumps the
+      catalog version.
 
     """ 
     print('Video wurde gepeichert')
-    if created: 
+    bump_catalog_version(instance.pk)
+    if not created:
+        return
+    _reuse_renditions(instance)
+    original = getattr(instance, '_waits_for', None)
+    if original is not None:
+        # The original may have become ready before this video was committed
+        transaction.on_commit(lambda: share_output(original.pk))
+    elif instance.status == Video.Status.PENDING: 
         print('New Video created')
-        queue = django_rq.get_queue('default', autocommit=True)
-        queue.enqueue(convert_480p, instance.video_file.path, instance.id)
-        queue.enqueue(convert_720p, instance.video_file.path, instance.id)
+        transaction.on_commit(lambda: _enqueue_transcode(instance))
+
+
+def _enqueue_transcode(instance):
+    queue = django_rq.get_queue('default', autocommit=True)
+    queue.enqueue(transcode_video, instance.video_file.path, instance.id,
+                  job_id=transcode_job_id(instance.id), on_failure=mark_failed)
 
 
 @receiver(post_delete, sender = Video)
@@ -28,32 +80,41 @@ def video_post_delete(sender, instance,  **kwargs):
     Deletes file from filesystem
     when corresponding `MediaFile` object is deleted.
     """
-    if instance.video_file:
+    bump_catalog_version(instance.pk)
+    if instance.video_file and not _is_shared(instance, 'video_file'):
         if os.path.isfile(instance.video_file.path):
             os.remove(instance.video_file.path)
 
+    stream_path = os.path.join(settings.MEDIA_ROOT, streaming_dir(instance.id))
+    if os.path.isdir(stream_path) and not _is_shared(instance, 'hls_playlist', 'dash_manifest'):
+        shutil.rmtree(stream_path)
 
+    image_path = os.path.join(settings.MEDIA_ROOT, artwork_dir(instance.id))
+    if os.path.isdir(image_path) and not _is_shared(instance, 'poster'):
+        shutil.rmtree(image_path)
 
-@receiver(post_save, sender=Video)
-def update_converted_files(sender, instance, **kwargs):
+
+def _reuse_renditions(instance):
     """
-    Signal handler that is triggered after a Video object is saved.
+    Give a duplicate upload the rendition rows of the video it duplicates.
 
-    Checks if the converted versions of the video (480p and 720p) exist 
-    and saves them in the respective fields of the Video instance.
+    :return: The number of reused renditions.
+    :rtype: int
     """
-    base, ext = os.path.splitext(instance.video_file.path)
+    original = getattr(instance, '_duplicate_of', None)
+    if original is None:
+        return 0
+    renditions = [Rendition(video=instance, profile=r.profile, file=r.file.name)
+                  for r in original.renditions.all()]
+    return len(Rendition.objects.bulk_create(renditions))
 
-    # Überprüfen und Aktualisieren der 480p-Version
-    video_480p_path = f"{base}_480p{ext}"
-    if os.path.exists(video_480p_path) and not instance.video_480p:
-        with open(video_480p_path, 'rb') as f:
-            instance.video_480p.save(f"{instance.title}_480p{ext}", File(f))
-        instance.save()
 
-    # Überprüfen und Aktualisieren der 720p-Version
-    video_720p_path = f"{base}_720p{ext}"
-    if os.path.exists(video_720p_path) and not instance.video_720p:
-        with open(video_720p_path, 'rb') as f:
-            instance.video_720p.save(f"{instance.title}_720p{ext}", File(f))
-        instance.save()
+def _is_shared(instance, *fields):
+    """
+    Check if another video still uses one of the given files of the instance.
+    """
+    for field in fields:
+        name = getattr(instance, field).name
+        if name and Video.objects.filter(**{field: name}).exclude(pk=instance.pk).exists():
+            return True
+    return False
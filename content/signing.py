@@ -0,0 +1,107 @@
+"""
+Expiring HMAC-signed media URLs.
+
+A signed URL carries its token in the path::
+
+    /media/signed/<stamp>/<signature>/<path>
+
+``stamp`` is the expiry as unix time. ``signature`` is the unpadded
+base64url HMAC-SHA256 of ``<stamp>|<scope>`` with ``MEDIA_URL_SIGNING_KEY``.
+``scope`` is the file path, except for files in a per-video stream or
+image directory, where it is the directory (``videos/streams/12/``).
+HLS/DASH playlists and the sprite index reference their segments and images
+relatively, and those requests inherit the token from the path.
+
+The front proxy checks the signature and the expiry itself and serves the
+file directly. Everything it needs is in the URL and the shared key, so
+Python is never called. Use, for example, an nginx HMAC secure-link module
+or an edge function of the CDN. :class:`content.views.MediaFileView`
+performs the same check when Django serves media itself.
+
+Expiries are rounded up to ``MEDIA_URL_BUCKET`` seconds, so every URL
+signed within one bucket is identical. Cached catalog pages stay shareable,
+and the catalog version rolls over once per bucket (see
+:func:`media_url_bucket`). For the same reason URLs are not bound to a
+user: every response is joined from fragments shared by all users.
+"""
+import base64
+import hashlib
+import hmac
+import posixpath
+import re
+import time
+from django.conf import settings
+from django.utils.encoding import filepath_to_uri
+
+MEDIA_URL_SIGNING_KEY = getattr(settings, 'MEDIA_URL_SIGNING_KEY', None)
+MEDIA_URL_TTL = getattr(settings, 'MEDIA_URL_TTL', 60 * 60)
+MEDIA_URL_BUCKET = getattr(settings, 'MEDIA_URL_BUCKET', 60 * 60)
+SIGNED_PREFIX = 'signed/'
+
+# Per-video directories whose files are referenced relatively by a playlist or index
+SCOPE_RE = re.compile(r'^videos/(?:streams|images)/\d+/')
+STAMP_RE = re.compile(r'^\d+$')
+
+
+def signing_enabled():
+    return bool(MEDIA_URL_SIGNING_KEY)
+
+
+def media_url_bucket(now=None):
+    """
+    Index of the current expiry bucket, or ``None`` when signing is off.
+    """
+    if not signing_enabled():
+        return None
+    return int(now if now is not None else time.time()) // MEDIA_URL_BUCKET
+
+
+def media_scope(name):
+    """
+    Part of the path a signature is valid for.
+    """
+    match = SCOPE_RE.match(name)
+    return match.group(0) if match else name
+
+
+def media_signature(stamp, scope):
+    digest = hmac.new(MEDIA_URL_SIGNING_KEY.encode(), f'{stamp}|{scope}'.encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+def sign_media_url(name, now=None):
+    """
+    Return the signed URL of a stored file.
+
+    :param name: Storage name of the file, relative to ``MEDIA_ROOT``.
+    :return: URL valid until the end of the current bucket plus ``MEDIA_URL_TTL``.
+    :rtype: str
+    """
+    stamp = str((media_url_bucket(now) + 1) * MEDIA_URL_BUCKET + MEDIA_URL_TTL)
+    signature = media_signature(stamp, media_scope(name))
+    return f'{settings.MEDIA_URL}{SIGNED_PREFIX}{stamp}/{signature}/{filepath_to_uri(name)}'
+
+
+def verify_media_path(path, now=None):
+    """
+    Check the token of a signed media path.
+
+    :param path: Path below ``MEDIA_URL``, starting with ``signed/``.
+    :return: The storage name of the file, or ``None`` if the token is
+        missing, invalid or expired.
+    :rtype: str
+    """
+    if not path.startswith(SIGNED_PREFIX):
+        return None
+    parts = path[len(SIGNED_PREFIX):].split('/', 2)
+    if len(parts) != 3:
+        return None
+    stamp, signature, name = parts
+    if posixpath.normpath(name) != name:
+        # ``..`` would leave the directory the signature is scoped to
+        return None
+    if not STAMP_RE.match(stamp) or int(stamp) < (now if now is not None else time.time()):
+        return None
+    if not hmac.compare_digest(signature, media_signature(stamp, media_scope(name))):
+        return None
+    return name
@@ -0,0 +1,15 @@
+from django.core.files.storage import FileSystemStorage
+from .signing import sign_media_url, signing_enabled
+
+
+class SignedMediaStorage(FileSystemStorage):
+    """
+    File system storage whose URLs are signed and expire once
+    ``MEDIA_URL_SIGNING_KEY`` is set (see :mod:`content.signing`).
+    Serializers, the catalog fragments and the admin all get signed URLs
+    through ``FieldFile.url`` without further changes.
+    """
+    def url(self, name):
+        if name is not None and signing_enabled():
+            return sign_media_url(name)
+        return super().url(name)
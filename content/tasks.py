@@ -1,39 +1,579 @@
-import subprocess 
+import json
+import logging
+import math
+import shutil
+import subprocess
 import os
-from content.models import Video
-from django.core.files import File
-
-def convert_480p(source, video_id):
-    os.environ['PATH'] += r';C:\Dev\tools\ffmpeg\ffmpeg-master-latest-win64-gpl\ffmpeg-master-latest-win64-gpl\bin'
-    base, ext = os.path.splitext(source)
-    target = f"{base}_480p{ext}"
-    cmd = r'C:\Dev\tools\ffmpeg\ffmpeg-master-latest-win64-gpl\ffmpeg-master-latest-win64-gpl\bin\ffmpeg -i "{}" -s hd480 -c:v libx264 -crf 23 -c:a aac -strict -2 "{}"'.format(source, target)
-    subprocess.run(cmd, shell=True, check=True)
-    update_converted_files(video_id)
-
-def convert_720p(source, video_id):
-    os.environ['PATH'] += r';C:\Dev\tools\ffmpeg\ffmpeg-master-latest-win64-gpl\ffmpeg-master-latest-win64-gpl\bin'
-    base, ext = os.path.splitext(source)
-    target = f"{base}_720p{ext}"
-    cmd = r'C:\Dev\tools\ffmpeg\ffmpeg-master-latest-win64-gpl\ffmpeg-master-latest-win64-gpl\bin\ffmpeg -i "{}" -s  hd720 -c:v libx264 -crf 23 -c:a aac -strict -2 "{}"'.format(source, target)
-    subprocess.run(cmd, shell=True, check=True)
-    update_converted_files(video_id)
-
- 
-def update_converted_files(video_id):
-    video = Video.objects.get(id=video_id)
-    base, ext = os.path.splitext(video.video_file.path)
-
-    # Überprüfen und Aktualisieren der 480p-Version
-    video_480p_path = f"{base}_480p{ext}"
-    if os.path.exists(video_480p_path) and not video.video_480p:
-        with open(video_480p_path, 'rb') as f:
-            video.video_480p.save(f"{video.title}_480p{ext}", File(f))
-    
-    # Überprüfen und Aktualisieren der 720p-Version
-    video_720p_path = f"{base}_720p{ext}"
-    if os.path.exists(video_720p_path) and not video.video_720p:
-        with open(video_720p_path, 'rb') as f:
-            video.video_720p.save(f"{video.title}_720p{ext}", File(f))
-
-    video.save()
\ No newline at end of file
+import tempfile
+import django_rq
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from content.models import Rendition, Video
+from content.profiles import active_profiles
+from django.core.files.storage import default_storage
+from content.progress import parse_progress, publish_progress, summarize
+from content.catalog import bump_catalog_version
+
+FFMPEG_BIN = getattr(settings, 'FFMPEG_BIN', 'ffmpeg')
+FFPROBE_BIN = getattr(settings, 'FFPROBE_BIN', 'ffprobe')
+STREAMING_FORMATS = getattr(settings, 'VIDEO_STREAMING_FORMATS', [])
+SEGMENT_SECONDS = getattr(settings, 'VIDEO_SEGMENT_SECONDS', 6)
+CHUNK_SECONDS = getattr(settings, 'VIDEO_CHUNK_SECONDS', 60)
+CLAIM_LEASE = getattr(settings, 'VIDEO_CLAIM_LEASE', 60 * 60)
+
+logger = logging.getLogger(__name__)
+
+# Fields a duplicate upload takes over from the video it duplicates
+REUSED_FIELDS = ['video_480p', 'video_720p', 'hls_playlist', 'dash_manifest',
+                 'poster', 'thumbnail', 'sprite', 'sprite_vtt']
+
+# Seek-preview sprite: one sheet of SPRITE_COLUMNS x SPRITE_ROWS tiles
+SPRITE_COLUMNS = 10
+SPRITE_ROWS = 10
+SPRITE_TILE_WIDTH = 160
+
+
+def probe(source):
+    """
+    Read stream and container information of a media file with ffprobe.
+
+    :param source: Path of the media file.
+    :type source: str
+    :return: The parsed ffprobe output with ``streams`` and ``format``.
+    :rtype: dict
+    """
+    result = subprocess.run(
+        [FFPROBE_BIN, '-v', 'error', '-print_format', 'json', '-show_format', '-show_streams', source],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(result.stdout)
+
+
+def duration_of(info):
+    return float(info.get('format', {}).get('duration', 0) or 0)
+
+
+def run_ffmpeg(cmd, video_id, label, duration=None):
+    """
+    Run ffmpeg and publish its progress while it works.
+
+    ffmpeg writes machine-readable progress blocks to stdout; every block is
+    summarized and stored under ``label`` for the video.
+
+    :param cmd: The ffmpeg argument list, starting with the binary.
+    :type cmd: list
+    :param video_id: The video the run belongs to.
+    :param label: Name of the run, e.g. ``ladder`` or ``chunk 3``.
+    :type label: str
+    :param duration: Duration of the input in seconds, used for the ETA.
+    :type duration: float
+    :raises subprocess.CalledProcessError: If ffmpeg fails.
+    """
+    cmd = [cmd[0], '-progress', 'pipe:1', '-nostats', *cmd[1:]]
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True) as process:
+        for report in parse_progress(process.stdout):
+            try:
+                publish_progress(video_id, label, summarize(report, duration))
+            except Exception:
+                # Progress is informational; it must never abort the encode
+                logger.exception('Publishing progress of video %s (%s) failed', video_id, label)
+    if process.returncode:
+        publish_progress(video_id, label, {'status': 'failed'})
+        raise subprocess.CalledProcessError(process.returncode, cmd)
+
+
+def has_audio(info):
+    return any(stream.get('codec_type') == 'audio' for stream in info.get('streams', []))
+
+
+def streaming_dir(video_id):
+    """
+    Return the media-relative directory that holds the segmented output of a video.
+    """
+    return f"videos/streams/{video_id}"
+
+
+def build_packaging_command(inputs, output_dir, formats, audio=True):
+    """
+    Build an ffmpeg command that cuts already encoded renditions into
+    HLS/DASH segments without re-encoding them.
+
+    The renditions were encoded on the keyframe grid of
+    :func:`keyframe_args`, so every rendition is cut at the same timestamps
+    and players can switch between them at segment boundaries.
+
+    :param inputs: Rendition files in profile order.
+    :type inputs: list
+    :return: The ffmpeg argument list.
+    :rtype: list
+    """
+    cmd = [FFMPEG_BIN, '-y']
+    for path in inputs:
+        cmd += ['-i', path]
+    for i in range(len(inputs)):
+        cmd += ['-map', f'{i}:v:0']
+        if audio:
+            cmd += ['-map', f'{i}:a:0']
+    return cmd + ['-c', 'copy'] + streaming_muxer_args(output_dir, formats, audio)
+
+
+def package_streams(video_id, inputs, audio=True):
+    """
+    Write the segmented ``VIDEO_STREAMING_FORMATS`` output of a video from
+    its encoded renditions and point the playlist fields at it.
+    """
+    output_dir = os.path.join(settings.MEDIA_ROOT, streaming_dir(video_id))
+    for name in active_profiles():
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+    subprocess.run(build_packaging_command(inputs, output_dir, STREAMING_FORMATS, audio), check=True)
+    update_streaming_files(video_id, STREAMING_FORMATS)
+
+
+def keyframe_args():
+    """
+    Force keyframes on the segment grid so every rendition can be segmented
+    at the same timestamps.
+    """
+    return ['-force_key_frames', f'expr:gte(t,n_forced*{SEGMENT_SECONDS})']
+
+
+def streaming_muxer_args(output_dir, formats, audio=True):
+    """
+    Return the muxer part of a segmented output.
+
+    HLS alone uses the hls muxer; as soon as DASH is requested the dash muxer
+    writes CMAF segments and, with HLS enabled too, an HLS master playlist for
+    the same segments.
+    """
+    names = list(active_profiles())
+    if 'dash' in formats:
+        args = ['-f', 'dash', '-seg_duration', str(SEGMENT_SECONDS),
+                '-use_template', '1', '-use_timeline', '1',
+                '-adaptation_sets', 'id=0,streams=v id=1,streams=a' if audio else 'id=0,streams=v']
+        if 'hls' in formats:
+            args += ['-hls_playlist', '1', '-hls_master_name', 'master.m3u8']
+        return args + [os.path.join(output_dir, 'manifest.mpd')]
+
+    stream_map = ' '.join(
+        f"v:{i},a:{i},name:{name}" if audio else f"v:{i},name:{name}"
+        for i, name in enumerate(names)
+    )
+    return ['-f', 'hls', '-hls_time', str(SEGMENT_SECONDS), '-hls_playlist_type', 'vod',
+            '-hls_segment_filename', os.path.join(output_dir, '%v', 'segment_%05d.ts'),
+            '-master_pl_name', 'master.m3u8', '-var_stream_map', stream_map,
+            os.path.join(output_dir, '%v', 'index.m3u8')]
+
+
+def build_ladder_command(source, targets, extra=None):
+    """
+    Build one ffmpeg command that decodes the source once and encodes every
+    rendition from that single decode.
+
+    :param source: Path of the uploaded source file.
+    :type source: str
+    :param targets: Mapping of profile name to output path.
+    :type targets: dict
+    :param extra: Further outputs (segmented streams, artwork) written by the same run.
+    :type extra: list
+    :return: The ffmpeg argument list.
+    :rtype: list
+    """
+    cmd = [FFMPEG_BIN, '-y', '-i', source]
+    profiles = active_profiles()
+    for rendition, target in targets.items():
+        cmd += ['-map', '0:v:0', '-map', '0:a?', *profiles[rendition].video_args(), *keyframe_args(), target]
+    return cmd + (extra or [])
+
+
+def convert_renditions(source, video_id):
+    """
+    Transcode the source into all renditions in one ffmpeg run and
+    register the results on the video afterwards.
+
+    The same run also writes the poster, thumbnail and seek-preview sprite.
+    When ``VIDEO_STREAMING_FORMATS`` is set, the finished renditions are cut
+    into the segmented HLS/DASH output by stream copy, so no rendition is
+    encoded twice.
+    """
+    info = probe(source)
+    names = rendition_names(source)
+    targets = {rendition: partial_path(name) for rendition, name in names.items()}
+    extra = build_artwork_args(video_id, info)
+    run_ffmpeg(build_ladder_command(source, targets, extra), video_id, 'ladder', duration_of(info))
+    if STREAMING_FORMATS:
+        package_streams(video_id, list(targets.values()), has_audio(info))
+    register_artwork(video_id, info)
+    register_renditions(video_id, names)
+    mark_ready(video_id)
+
+
+def transcode_job_id(video_id, step=None):
+    """
+    Return the RQ job id of a transcode step. Ids are fixed per video so a
+    step is never queued twice under different ids.
+    """
+    return f"transcode-{video_id}" if step is None else f"transcode-{video_id}-{step}"
+
+
+def claim_video(video_id):
+    """
+    Move a video from pending (or failed, for retries) to encoding.
+
+    The conditional UPDATE makes the claim atomic, so only one job ever
+    encodes a video even if the job is delivered twice. A claim is a lease of
+    ``VIDEO_CLAIM_LEASE`` seconds: a video still encoding after that was left
+    behind by a killed worker, which runs no failure callback, and is taken
+    over by the next job.
+
+    :return: Whether this job got the video.
+    :rtype: bool
+    """
+    now = timezone.now()
+    expired = Q(status=Video.Status.ENCODING) & (
+        Q(claimed_at__isnull=True) | Q(claimed_at__lt=now - timedelta(seconds=CLAIM_LEASE)))
+    claimed = Video.objects.filter(
+        Q(status__in=[Video.Status.PENDING, Video.Status.FAILED]) | expired, id=video_id,
+    ).update(status=Video.Status.ENCODING, claimed_at=now)
+    if claimed:
+        bump_catalog_version(video_id)
+    return bool(claimed)
+
+
+def renew_claim(video_id):
+    """
+    Extend the lease of an encoding video; every step of a chunked transcode
+    renews it, so a long video is not taken over while its chunks run.
+    """
+    Video.objects.filter(id=video_id, status=Video.Status.ENCODING).update(claimed_at=timezone.now())
+
+
+def mark_ready(video_id):
+    Video.objects.filter(id=video_id).update(status=Video.Status.READY)
+    bump_catalog_version(video_id)
+    share_output(video_id)
+
+
+def mark_failed(job, connection, type, value, traceback):
+    """
+    RQ failure callback of every transcode job; the video id is the second job argument.
+
+    Duplicates waiting for the video fail with it, so they can be retried.
+    """
+    video_id = job.args[1]
+    Video.objects.filter(id=video_id).update(status=Video.Status.FAILED)
+    bump_catalog_version(video_id)
+    for duplicate_id in waiting_duplicates(video_id).filter(status=Video.Status.PENDING).values_list('id', flat=True):
+        Video.objects.filter(id=duplicate_id).update(status=Video.Status.FAILED)
+        bump_catalog_version(duplicate_id)
+
+
+def waiting_duplicates(video_id):
+    """
+    Return the duplicates of a video that have no output of their own yet:
+    uploads of the same content that are pending or failed.
+    """
+    content_hash = Video.objects.filter(id=video_id).values_list('content_hash', flat=True).first()
+    if not content_hash:
+        return Video.objects.none()
+    return (Video.objects.filter(content_hash=content_hash, status__in=[Video.Status.PENDING, Video.Status.FAILED])
+            .exclude(id=video_id))
+
+
+def share_output(video_id):
+    """
+    Hand the renditions and artwork of a video to the duplicates that were
+    uploaded while it was still encoding; they are not encoded again. Does
+    nothing unless the video is ready.
+
+    :return: Number of duplicates that became ready.
+    :rtype: int
+    """
+    original = Video.objects.filter(id=video_id, status=Video.Status.READY).prefetch_related('renditions').first()
+    duplicates = list(waiting_duplicates(video_id).values_list('id', flat=True)) if original else []
+    if not duplicates:
+        return 0
+    fields = {field: getattr(original, field).name for field in REUSED_FIELDS}
+    for duplicate_id in duplicates:
+        Video.objects.filter(id=duplicate_id).update(status=Video.Status.READY, **fields)
+        Rendition.objects.bulk_create(
+            [Rendition(video_id=duplicate_id, profile=r.profile, file=r.file.name) for r in original.renditions.all()],
+            update_conflicts=True, unique_fields=['video', 'profile'], update_fields=['file'],
+        )
+        bump_catalog_version(duplicate_id)
+    return len(duplicates)
+
+
+def transcode_video(source, video_id):
+    """
+    Entry job for a new upload.
+
+    Short videos are converted in this job. Longer ones are cut on keyframe
+    boundaries into chunks of about ``VIDEO_CHUNK_SECONDS``; every chunk is
+    converted by its own job on any free worker and a final job stitches the
+    pieces back together once all chunks are done. The artwork of long videos
+    is taken from their keyframes only, which is far cheaper than a full decode.
+
+    The job does nothing unless it can claim the video, so a redelivered job
+    never encodes a video twice.
+    """
+    if not claim_video(video_id):
+        return
+    info = probe(source)
+    if duration_of(info) <= 2 * CHUNK_SECONDS:
+        convert_renditions(source, video_id)
+        return
+
+    artwork = [FFMPEG_BIN, '-y', '-skip_frame', 'nokey', '-i', source, *build_artwork_args(video_id, info)]
+    run_ffmpeg(artwork, video_id, 'artwork', duration_of(info))
+    register_artwork(video_id, info)
+
+    work_dir = chunk_dir(source, video_id)
+    chunks = split_source(source, work_dir)
+    queue = django_rq.get_queue('default', autocommit=True)
+    jobs = [
+        queue.enqueue(convert_chunk, chunk, video_id, index,
+                      job_id=transcode_job_id(video_id, f'chunk-{index}'), on_failure=mark_failed)
+        for index, chunk in enumerate(chunks)
+    ]
+    audio = has_audio(info)
+    if audio:
+        jobs.append(queue.enqueue(convert_audio, source, video_id, work_dir,
+                                  job_id=transcode_job_id(video_id, 'audio'), on_failure=mark_failed))
+    queue.enqueue(stitch_chunks, source, video_id, work_dir, chunks, audio, depends_on=jobs,
+                  job_id=transcode_job_id(video_id, 'stitch'), on_failure=mark_failed)
+
+
+def chunk_dir(source, video_id):
+    """
+    Create a fresh work directory for the chunks of one transcode attempt.
+
+    Every attempt gets its own directory, so a retry never picks up the
+    output of an earlier attempt and videos sharing a source never share
+    chunks.
+    """
+    return tempfile.mkdtemp(prefix=f'chunks_{video_id}_', dir=os.path.dirname(source))
+
+
+def split_source(source, work_dir):
+    """
+    Cut the video stream of the source into chunks without re-encoding it.
+
+    With stream copy the segment muxer can only cut on keyframes, so every
+    chunk starts with a keyframe and decodes on its own. Audio is left out;
+    it is encoded once from the whole source (:func:`convert_audio`).
+
+    :return: The chunk paths in playback order, as listed by the muxer.
+    :rtype: list
+    """
+    ext = os.path.splitext(source)[1]
+    list_path = os.path.join(work_dir, 'chunks.txt')
+    subprocess.run([
+        FFMPEG_BIN, '-y', '-i', source, '-map', '0:v:0', '-an', '-c', 'copy',
+        '-f', 'segment', '-segment_time', str(CHUNK_SECONDS), '-reset_timestamps', '1',
+        '-segment_list', list_path, '-segment_list_type', 'flat',
+        os.path.join(work_dir, f'chunk_%05d{ext}'),
+    ], check=True)
+    with open(list_path) as f:
+        return [os.path.join(work_dir, line.strip()) for line in f if line.strip()]
+
+
+def chunk_targets(chunk):
+    base, ext = os.path.splitext(chunk)
+    return {rendition: f"{base}_{rendition}{ext}" for rendition in active_profiles()}
+
+
+def audio_path(work_dir):
+    return os.path.join(work_dir, 'audio.m4a')
+
+
+def convert_chunk(chunk, video_id, index):
+    """
+    Transcode one chunk into all renditions in a single ffmpeg run.
+    """
+    renew_claim(video_id)
+    command = build_ladder_command(chunk, chunk_targets(chunk))
+    run_ffmpeg(command, video_id, f'chunk {index}', duration_of(probe(chunk)))
+
+
+def convert_audio(source, video_id, work_dir):
+    """
+    Encode the audio of the whole source once, in parallel to the chunks.
+
+    Encoding it per chunk would add encoder priming at every chunk boundary,
+    heard as gaps and drifting away from the picture.
+    """
+    renew_claim(video_id)
+    codec = next(iter(active_profiles().values())).audio_codec
+    command = [FFMPEG_BIN, '-y', '-i', source, '-map', '0:a:0', '-vn', '-c:a', codec, audio_path(work_dir)]
+    run_ffmpeg(command, video_id, 'audio', duration_of(probe(source)))
+
+
+def stitch_chunks(source, video_id, work_dir, chunks, audio=True):
+    """
+    Join the converted chunks of every rendition with the concat demuxer
+    and mux in the audio track (stream copy, no quality loss), package the
+    segmented output from the joined files and register everything on the
+    video.
+    """
+    renew_claim(video_id)
+    names = rendition_names(source)
+    targets = {rendition: partial_path(name) for rendition, name in names.items()}
+    for rendition, target in targets.items():
+        list_path = os.path.join(work_dir, f'{rendition}.txt')
+        with open(list_path, 'w') as f:
+            for chunk in chunks:
+                path = chunk_targets(chunk)[rendition].replace("'", "'\\''")
+                f.write(f"file '{path}'\n")
+        cmd = [FFMPEG_BIN, '-y', '-f', 'concat', '-safe', '0', '-i', list_path]
+        if audio:
+            cmd += ['-i', audio_path(work_dir), '-map', '0:v:0', '-map', '1:a:0']
+        subprocess.run([*cmd, '-c', 'copy', target], check=True)
+
+    if STREAMING_FORMATS:
+        package_streams(video_id, list(targets.values()), audio)
+
+    register_renditions(video_id, names)
+    mark_ready(video_id)
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def artwork_dir(video_id):
+    """
+    Return the media-relative directory that holds the images of a video.
+    """
+    return f"videos/images/{video_id}"
+
+
+def sprite_layout(info):
+    """
+    Work out the seek-preview sprite for a video.
+
+    :return: Seconds between tiles, tile width and tile height.
+    :rtype: tuple
+    """
+    video = next((s for s in info.get('streams', []) if s.get('codec_type') == 'video'), {})
+    width, height = video.get('width'), video.get('height')
+    tile_height = round(SPRITE_TILE_WIDTH * height / width / 2) * 2 if width and height else 90
+    interval = max(duration_of(info) / (SPRITE_COLUMNS * SPRITE_ROWS), 1)
+    return interval, SPRITE_TILE_WIDTH, tile_height
+
+
+def build_artwork_args(video_id, info):
+    """
+    Build the ffmpeg outputs for the poster, the thumbnail and the
+    seek-preview sprite sheet of a video.
+
+    :return: The ffmpeg argument list.
+    :rtype: list
+    """
+    output_dir = os.path.join(settings.MEDIA_ROOT, artwork_dir(video_id))
+    os.makedirs(output_dir, exist_ok=True)
+    interval, tile_width, tile_height = sprite_layout(info)
+    single = ['-frames:v', '1', '-update', '1']
+    return [
+        '-map', '0:v:0', '-vf', 'thumbnail,scale=1280:-2', *single, os.path.join(output_dir, 'poster.jpg'),
+        '-map', '0:v:0', '-vf', 'thumbnail,scale=320:-2', *single, os.path.join(output_dir, 'thumbnail.jpg'),
+        '-map', '0:v:0',
+        '-vf', f'fps=1/{interval},scale={tile_width}:{tile_height},tile={SPRITE_COLUMNS}x{SPRITE_ROWS}',
+        *single, os.path.join(output_dir, 'sprite.jpg'),
+    ]
+
+
+def build_sprite_vtt(info):
+    """
+    Build the WebVTT index that maps playback time to a tile of the sprite.
+    """
+    duration = duration_of(info)
+    interval, tile_width, tile_height = sprite_layout(info)
+    lines = ['WEBVTT', '']
+    for index in range(min(math.ceil(duration / interval), SPRITE_COLUMNS * SPRITE_ROWS)):
+        start = index * interval
+        end = min(start + interval, duration)
+        x, y = (index % SPRITE_COLUMNS) * tile_width, (index // SPRITE_COLUMNS) * tile_height
+        lines += [f'{vtt_time(start)} --> {vtt_time(end)}', f'sprite.jpg#xywh={x},{y},{tile_width},{tile_height}', '']
+    return '\n'.join(lines)
+
+
+def vtt_time(seconds):
+    hours, rest = divmod(seconds, 3600)
+    minutes, rest = divmod(rest, 60)
+    return f'{int(hours):02d}:{int(minutes):02d}:{rest:06.3f}'
+
+
+def register_artwork(video_id, info):
+    """
+    Write the sprite index and point the image fields of the video at the
+    files written by ffmpeg.
+    """
+    directory = artwork_dir(video_id)
+    with open(os.path.join(settings.MEDIA_ROOT, directory, 'sprite.vtt'), 'w') as f:
+        f.write(build_sprite_vtt(info))
+    Video.objects.filter(id=video_id).update(
+        poster=f"{directory}/poster.jpg",
+        thumbnail=f"{directory}/thumbnail.jpg",
+        sprite=f"{directory}/sprite.jpg",
+        sprite_vtt=f"{directory}/sprite.vtt",
+    )
+    bump_catalog_version(video_id)
+
+
+def update_streaming_files(video_id, formats):
+    """
+    Point the playlist fields of the video at the files written by ffmpeg.
+    """
+    fields = {}
+    if 'hls' in formats:
+        fields['hls_playlist'] = f"{streaming_dir(video_id)}/master.m3u8"
+    if 'dash' in formats:
+        fields['dash_manifest'] = f"{streaming_dir(video_id)}/manifest.mpd"
+    Video.objects.filter(id=video_id).update(**fields)
+
+
+def rendition_names(source):
+    """
+    Reserve the final storage names of all renditions of a source.
+
+    :return: Mapping of profile name to media-relative name, e.g.
+        ``videos/480p/clip_480p.mp4``.
+    :rtype: dict
+    """
+    base, ext = os.path.splitext(os.path.basename(source))
+    names = {}
+    for rendition in active_profiles():
+        name = default_storage.get_available_name(f"videos/{rendition}/{base}_{rendition}{ext}")
+        os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+        names[rendition] = name
+    return names
+
+
+def partial_path(name):
+    """
+    Return the path ffmpeg writes a rendition to before it is published.
+
+    It lives in the same directory as the final file so publishing is a
+    rename on the same filesystem.
+    """
+    base, ext = os.path.splitext(default_storage.path(name))
+    return f"{base}.part{ext}"
+
+
+def register_renditions(video_id, names):
+    """
+    Publish finished renditions and record them in the rendition table.
+
+    Every file is moved into place with an atomic rename and registered by
+    name, so no byte is copied and no second copy stays on disk. Profiles
+    that have a column of their own on ``Video`` (480p, 720p) fill it too.
+    """
+    for name in names.values():
+        os.replace(partial_path(name), default_storage.path(name))
+    Rendition.objects.bulk_create(
+        [Rendition(video_id=video_id, profile=profile, file=name) for profile, name in names.items()],
+        update_conflicts=True, unique_fields=['video', 'profile'], update_fields=['file'],
+    )
+    legacy = {Video.RENDITION_FIELDS[profile]: name for profile, name in names.items()
+              if profile in Video.RENDITION_FIELDS}
+    if legacy:
+        Video.objects.filter(id=video_id).update(**legacy)
@@ -1,11 +1,57 @@
-from datetime import date
-from django.test import TestCase
+import json
+from asgiref.sync import sync_to_async
+import base64
+import gzip
+import hashlib
+import time
+from datetime import date, timedelta
+from unittest.mock import patch
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.core.files.uploadedfile import SimpleUploadedFile
 import os
-from content.models import Video
+import shutil
+import tempfile
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from content.models import Rendition, UploadSession, Video
+from content.profiles import EncodingProfile, active_profiles
+from content.uploadhandlers import HashingTemporaryFileUploadHandler
+from content.catalog import (CATALOG_BROWSE_KEY, browse_lock_key, catalog_cache_key, catalog_lock_key, get_catalog_payload, get_catalog_version,
+                             refresh_browse, refresh_catalog)
+from content.compression import choose_encoding
+from content.fragments import (drop_fragment, fragment_key, fragment_snapshot, get_fragments, get_revisions,
+                               video_data)
+from content.pagination import encode_cursor
+from content.signing import MEDIA_URL_BUCKET, sign_media_url, verify_media_path
+from content.serializers import VideoSerializer
+from content.progress import get_progress, parse_progress, publish_progress, summarize
+from content import asynccache
+from content.tasks import (build_artwork_args, chunk_dir, convert_audio, split_source, claim_video, mark_failed, mark_ready, build_ladder_command, build_sprite_vtt, build_packaging_command, convert_chunk, convert_renditions,
+                           partial_path, register_renditions, rendition_names, run_ffmpeg, stitch_chunks, transcode_video)
 
-class VideoModelTest(TestCase):
+
+class MediaRootTestCase(TestCase):
+    """
+    Stores uploads and encoder output of every test in a temporary
+    ``MEDIA_ROOT`` that is removed afterwards.
+    """
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+
+class VideoModelTest(MediaRootTestCase):
     def setUp(self):
+        super().setUp()
         self.video_file = SimpleUploadedFile("test_video.mp4", b"file_content", content_type="video/mp4")
         self.video = Video.objects.create(
             title='Test Video',
@@ -50,4 +96,902 @@ class VideoModelTest(TestCase):
      self.assertTrue(uploaded_file_name.endswith('.mp4'))
 
 
-   
+class ConvertRenditionsTest(MediaRootTestCase):
+
+    def test_ladder_command_decodes_source_once(self):
+        cmd = build_ladder_command('/media/videos/clip.mp4', {
+            '480p': '/media/videos/clip_480p.mp4',
+            '720p': '/media/videos/clip_720p.mp4',
+        })
+        self.assertEqual(cmd.count('-i'), 1)
+        self.assertIn('hd480', cmd)
+        self.assertIn('hd720', cmd)
+        self.assertEqual(cmd[-1], '/media/videos/clip_720p.mp4')
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_new_video_enqueues_single_job(self, get_queue):
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(
+                title='Ladder',
+                description='Ladder job',
+                video_file=SimpleUploadedFile('ladder.mp4', b'file_content'),
+                category='Test Category'
+            )
+        self.assertEqual(len(transcode_calls(get_queue)), 1)
+
+
+def transcode_calls(get_queue):
+    """
+    Return the transcode jobs enqueued on a mocked queue.
+    """
+    return [c for c in get_queue.return_value.enqueue.call_args_list if c.args[0] is transcode_video]
+
+
+def fake_ffmpeg(cmd, *args, **kwargs):
+    """
+    Stand-in for the ffmpeg run that creates the partial rendition files.
+    """
+    for arg in cmd:
+        if '.part.' in arg:
+            with open(arg, 'wb') as f:
+                f.write(b'rendition')
+
+
+class StreamingOutputTest(MediaRootTestCase):
+
+    def test_hls_only_uses_hls_muxer_with_master_playlist(self):
+        args = build_packaging_command(['/p/480p.mp4', '/p/720p.mp4'], '/out', ['hls'])
+        self.assertEqual(args[args.index('-c') + 1], 'copy')
+        self.assertIn('hls', args)
+        self.assertIn('master.m3u8', args)
+        self.assertIn('v:0,a:0,name:480p v:1,a:1,name:720p', args)
+        self.assertEqual(args[-1], '/out/%v/index.m3u8')
+
+    def test_dash_with_hls_shares_segments(self):
+        args = build_packaging_command(['/p/480p.mp4', '/p/720p.mp4'], '/out', ['hls', 'dash'], audio=False)
+        self.assertIn('dash', args)
+        self.assertIn('-hls_playlist', args)
+        self.assertNotIn('0:a:0', args)
+        self.assertEqual(args[-1], '/out/manifest.mpd')
+
+    @patch('content.tasks.STREAMING_FORMATS', ['hls'])
+    @patch('content.tasks.probe', return_value={'format': {'duration': '10.0'}, 'streams': [{'codec_type': 'video'}]})
+    @patch('content.tasks.subprocess.run')
+    @patch('content.tasks.run_ffmpeg', side_effect=fake_ffmpeg)
+    @patch('content.signals.django_rq.get_queue')
+    def test_convert_registers_master_playlist(self, get_queue, run, package, probe):
+        video = Video.objects.create(
+            title='Stream',
+            description='Segmented',
+            video_file=SimpleUploadedFile('stream.mp4', b'file_content'),
+            category='Test Category'
+        )
+        convert_renditions(video.video_file.path, video.id)
+        video.refresh_from_db()
+        run.assert_called_once()
+        self.assertEqual(video.hls_playlist.name, f'videos/streams/{video.id}/master.m3u8')
+        self.assertFalse(video.dash_manifest)
+        self.assertEqual(video.poster.name, f'videos/images/{video.id}/poster.jpg')
+        self.assertIn(video.poster.path, run.call_args.args[0])
+        self.assertTrue(os.path.isfile(video.sprite_vtt.path))
+
+        # The renditions are encoded once; the segments are cut from them by stream copy
+        self.assertNotIn('-filter_complex', run.call_args.args[0])
+        packaging = package.call_args.args[0]
+        self.assertEqual(packaging[packaging.index('-c') + 1], 'copy')
+        self.assertEqual(packaging.count('-i'), 2)
+        self.assertTrue(all('.part.' in packaging[i + 1] for i, arg in enumerate(packaging) if arg == '-i'))
+
+
+@patch('content.tasks.claim_video', return_value=True)
+class ChunkedTranscodeTest(MediaRootTestCase):
+
+    @patch('content.tasks.convert_renditions')
+    @patch('content.tasks.probe', return_value={'format': {'duration': '30.0'}, 'streams': []})
+    def test_short_video_is_converted_in_one_job(self, probe, convert, claim):
+        transcode_video('/media/videos/short.mp4', 1)
+        convert.assert_called_once_with('/media/videos/short.mp4', 1)
+
+    @patch('content.tasks.register_artwork')
+    @patch('content.tasks.run_ffmpeg')
+    @patch('content.tasks.django_rq.get_queue')
+    @patch('content.tasks.chunk_dir', return_value='/w')
+    @patch('content.tasks.split_source', return_value=['/w/chunk_00000.mp4', '/w/chunk_00001.mp4', '/w/chunk_00002.mp4'])
+    @patch('content.tasks.probe', return_value={'format': {'duration': '600.0'}, 'streams': [{'codec_type': 'audio'}]})
+    def test_long_video_fans_out_chunks_and_stitches_after_them(self, probe, split, work_dir, get_queue, run,
+                                                                 artwork, claim):
+        enqueue = get_queue.return_value.enqueue
+        transcode_video('/media/videos/long.mp4', 1)
+
+        split.assert_called_once_with('/media/videos/long.mp4', '/w')
+        chunk_calls = [c for c in enqueue.call_args_list if c.args[0] is convert_chunk]
+        self.assertEqual(len(chunk_calls), 3)
+        audio_calls = [c for c in enqueue.call_args_list if c.args[0] is convert_audio]
+        self.assertEqual(audio_calls[0].args[1:], ('/media/videos/long.mp4', 1, '/w'))
+        stitch_call = enqueue.call_args_list[-1]
+        self.assertIs(stitch_call.args[0], stitch_chunks)
+        self.assertEqual(stitch_call.args[3:5], ('/w', split.return_value))
+        self.assertEqual(len(stitch_call.kwargs['depends_on']), 4)
+        self.assertEqual(stitch_call.kwargs['job_id'], 'transcode-1-stitch')
+        self.assertIn('nokey', run.call_args.args[0])
+
+    def test_every_attempt_gets_its_own_work_dir(self, claim):
+        with tempfile.TemporaryDirectory() as media:
+            source = os.path.join(media, 'shared.mp4')
+            first, second = chunk_dir(source, 1), chunk_dir(source, 1)
+            self.assertNotEqual(first, second)
+            self.assertEqual(os.path.dirname(first), media)
+
+    def test_chunks_are_read_from_the_segment_list(self, claim):
+        def segment(cmd, check):
+            work_dir = os.path.dirname(cmd[-1])
+            # Output of an earlier attempt must not be picked up
+            open(os.path.join(work_dir, 'chunk_00000_480p.mp4'), 'w').close()
+            with open(cmd[cmd.index('-segment_list') + 1], 'w') as f:
+                f.write('chunk_00000.mp4\nchunk_00001.mp4\n')
+
+        with tempfile.TemporaryDirectory() as work_dir, patch('content.tasks.subprocess.run', side_effect=segment):
+            chunks = split_source('/media/videos/long.mp4', work_dir)
+        self.assertEqual(chunks, [os.path.join(work_dir, 'chunk_00000.mp4'), os.path.join(work_dir, 'chunk_00001.mp4')])
+
+    @patch('content.tasks.mark_ready')
+    @patch('content.tasks.register_renditions')
+    @patch('content.tasks.subprocess.run')
+    def test_stitch_muxes_the_audio_encoded_once(self, run, register, ready, claim):
+        with tempfile.TemporaryDirectory() as media:
+            work_dir = chunk_dir(os.path.join(media, 'long.mp4'), 1)
+            chunks = [os.path.join(work_dir, 'chunk_00000.mp4'), os.path.join(work_dir, 'chunk_00001.mp4')]
+            with self.settings(VIDEO_PROFILES=['480p']), patch('content.tasks.STREAMING_FORMATS', []):
+                stitch_chunks(os.path.join(media, 'long.mp4'), 1, work_dir, chunks, True)
+            self.assertFalse(os.path.exists(work_dir))
+        cmd = run.call_args.args[0]
+        self.assertIn(os.path.join(work_dir, 'audio.m4a'), cmd)
+        self.assertEqual(cmd[cmd.index('-c') - 4:cmd.index('-c')], ['-map', '0:v:0', '-map', '1:a:0'])
+        register.assert_called_once()
+        ready.assert_called_once_with(1)
+
+class RegisterRenditionsTest(MediaRootTestCase):
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_renditions_are_renamed_into_place(self, get_queue):
+        video = Video.objects.create(
+            title='Zero Copy',
+            description='Renamed, not copied',
+            video_file=SimpleUploadedFile('zero_copy.mp4', b'file_content'),
+            category='Test Category'
+        )
+        names = rendition_names(video.video_file.path)
+        fake_ffmpeg([partial_path(name) for name in names.values()])
+        inode = os.stat(partial_path(names['480p'])).st_ino
+
+        register_renditions(video.id, names)
+        video.refresh_from_db()
+
+        self.assertEqual(video.video_480p.name, names['480p'])
+        self.assertEqual(video.renditions.get(profile='480p').file.name, names['480p'])
+        self.assertTrue(video.video_480p.name.startswith('videos/480p/zero_copy'))
+        self.assertEqual(os.stat(video.video_480p.path).st_ino, inode)
+        self.assertFalse(os.path.exists(partial_path(names['480p'])))
+
+
+class TranscodeProgressTest(MediaRootTestCase):
+
+    def test_progress_blocks_are_summarized_with_eta(self):
+        lines = ['frame=250\n', 'fps=50.0\n', 'out_time_us=10000000\n', 'speed=2.0x\n', 'progress=continue\n']
+        report = next(parse_progress(lines))
+        summary = summarize(report, duration=40.0)
+        self.assertEqual(summary['frame'], 250)
+        self.assertEqual(summary['percent'], 25.0)
+        self.assertEqual(summary['eta'], 15.0)
+        self.assertEqual(summary['status'], 'running')
+
+    def test_unknown_values_are_not_errors(self):
+        summary = summarize({'frame': '0', 'fps': 'N/A', 'out_time_us': 'N/A', 'out_time_ms': 'N/A',
+                             'speed': 'N/A', 'progress': 'continue'}, duration=40.0)
+        self.assertIsNone(summary['out_time'])
+        self.assertIsNone(summary['percent'])
+        self.assertIsNone(summary['speed'])
+        self.assertEqual(summary['fps'], 0.0)
+
+    @patch('content.tasks.publish_progress', side_effect=ConnectionError('redis down'))
+    @patch('content.tasks.subprocess.Popen')
+    def test_progress_errors_do_not_abort_ffmpeg(self, popen, publish):
+        process = popen.return_value.__enter__.return_value
+        process.stdout = ['out_time_us=N/A\n', 'progress=continue\n', 'out_time_us=1000000\n', 'progress=end\n']
+        process.returncode = 0
+        with self.assertLogs('content.tasks', 'ERROR'):
+            run_ffmpeg(['ffmpeg', '-i', 'in.mp4', 'out.mp4'], 1, 'ladder', 10.0)
+        self.assertEqual(publish.call_count, 2)
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_progress_endpoint_returns_published_runs(self, get_queue):
+        video = Video.objects.create(
+            title='Progress',
+            description='Tracked',
+            video_file=SimpleUploadedFile('progress.mp4', b'file_content'),
+            category='Test Category'
+        )
+        publish_progress(video.id, 'ladder', {'frame': 10, 'status': 'running'})
+        response = self.client.get(reverse('video-progress', args=[video.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['ladder']['frame'], 10)
+        self.assertEqual(get_progress(video.id), response.json())
+
+    def test_progress_endpoint_unknown_video(self):
+        response = self.client.get(reverse('video-progress', args=[999999]))
+        self.assertEqual(response.status_code, 404)
+
+
+class UploadDeduplicationTest(MediaRootTestCase):
+
+    def test_upload_handler_hashes_streamed_chunks(self):
+        handler = HashingTemporaryFileUploadHandler()
+        handler.new_file('video_file', 'clip.mp4', 'video/mp4', 6)
+        handler.receive_data_chunk(b'abc', 0)
+        handler.receive_data_chunk(b'def', 3)
+        uploaded = handler.file_complete(6)
+        self.assertEqual(uploaded.content_hash, hashlib.sha256(b'abcdef').hexdigest())
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_duplicate_reuses_source_and_renditions(self, get_queue):
+        original = Video.objects.create(
+            title='Original',
+            description='First upload',
+            video_file=SimpleUploadedFile('bird.mp4', b'same bytes'),
+            category='Animals'
+        )
+        Video.objects.filter(id=original.id).update(video_480p='videos/480p/bird_480p.mp4',
+                                                   video_720p='videos/720p/bird_720p.mp4',
+                                                   status=Video.Status.READY)
+        get_queue.reset_mock()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            duplicate = Video.objects.create(
+                title='Bird again',
+                description='Same clip, new title',
+                video_file=SimpleUploadedFile('bird_copy.mp4', b'same bytes'),
+                category='Animals'
+            )
+
+        self.assertEqual(duplicate.content_hash, hashlib.sha256(b'same bytes').hexdigest())
+        self.assertEqual(duplicate.video_file.name, original.video_file.name)
+        self.assertEqual(duplicate.video_480p.name, 'videos/480p/bird_480p.mp4')
+        self.assertEqual(duplicate.status, Video.Status.READY)
+        self.assertEqual(transcode_calls(get_queue), [])
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_duplicate_of_encoding_video_waits_for_its_output(self, get_queue):
+        with self.captureOnCommitCallbacks(execute=True):
+            original = Video.objects.create(title='Original', description='First upload', category='Animals',
+                                            video_file=SimpleUploadedFile('owl.mp4', b'owl bytes'))
+        claim_video(original.id)
+        get_queue.reset_mock()
+        with self.captureOnCommitCallbacks(execute=True):
+            duplicate = Video.objects.create(title='Owl again', description='Same clip', category='Animals',
+                                             video_file=SimpleUploadedFile('owl_copy.mp4', b'owl bytes'))
+        self.assertEqual(transcode_calls(get_queue), [])
+        self.assertEqual(duplicate.status, Video.Status.PENDING)
+
+        Rendition.objects.create(video=original, profile='480p', file='videos/480p/owl_480p.mp4')
+        Video.objects.filter(id=original.id).update(video_480p='videos/480p/owl_480p.mp4',
+                                                   poster='videos/images/1/poster.jpg')
+        mark_ready(original.id)
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.status, Video.Status.READY)
+        self.assertEqual(duplicate.video_480p.name, 'videos/480p/owl_480p.mp4')
+        self.assertEqual(duplicate.poster.name, 'videos/images/1/poster.jpg')
+        self.assertEqual(duplicate.renditions.get().file.name, 'videos/480p/owl_480p.mp4')
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_waiting_duplicate_fails_with_its_original(self, get_queue):
+        original = Video.objects.create(title='Original', description='First upload', category='Animals',
+                                        video_file=SimpleUploadedFile('cat.mp4', b'cat bytes'))
+        duplicate = Video.objects.create(title='Cat again', description='Same clip', category='Animals',
+                                         video_file=SimpleUploadedFile('cat_copy.mp4', b'cat bytes'))
+        job = type('Job', (), {'args': ('/source.mp4', original.id)})()
+        mark_failed(job, None, RuntimeError, RuntimeError('ffmpeg'), None)
+        duplicate.refresh_from_db()
+        self.assertEqual(duplicate.status, Video.Status.FAILED)
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_shared_source_survives_deleting_one_video(self, get_queue):
+        first = Video.objects.create(title='A', description='A', category='Food',
+                                     video_file=SimpleUploadedFile('grill.mp4', b'grill bytes'))
+        second = Video.objects.create(title='B', description='B', category='Food',
+                                      video_file=SimpleUploadedFile('grill.mp4', b'grill bytes'))
+        first.delete()
+        self.assertTrue(os.path.isfile(second.video_file.path))
+        second.delete()
+        self.assertFalse(os.path.isfile(second.video_file.path))
+
+
+class EncodingProfileTest(MediaRootTestCase):
+
+    def test_crf_and_bitrate_profiles(self):
+        crf = EncodingProfile('test', '640x360', crf=28, preset='fast')
+        self.assertEqual(crf.video_args(), ['-s', '640x360', '-c:v', 'libx264', '-preset', 'fast',
+                                            '-crf', '28', '-c:a', 'aac'])
+        bitrate = EncodingProfile('test', 'hd720', bitrate='3M')
+        self.assertIn('-b:v:1', bitrate.encoder_args(1))
+        self.assertNotIn('-crf:v:1', bitrate.encoder_args(1))
+
+    def test_active_profiles_follow_settings(self):
+        with self.settings(VIDEO_PROFILES=['360p', '1080p']):
+            self.assertEqual(list(active_profiles()), ['360p', '1080p'])
+            cmd = build_ladder_command('/in.mp4', {'360p': '/a.mp4', '1080p': '/b.mp4'})
+        self.assertIn('640x360', cmd)
+        self.assertIn('hd1080', cmd)
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_renditions_are_unique_per_video_and_profile(self, get_queue):
+        video = Video.objects.create(title='Unique', description='One per profile', category='Food',
+                                     video_file=SimpleUploadedFile('unique.mp4', b'unique bytes'))
+        names = rendition_names(video.video_file.path)
+        fake_ffmpeg([partial_path(name) for name in names.values()])
+        register_renditions(video.id, names)
+        fake_ffmpeg([partial_path(name) for name in names.values()])
+        register_renditions(video.id, names)
+        self.assertEqual(Rendition.objects.filter(video=video).count(), len(names))
+
+
+class ResumableUploadTest(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        admin = get_user_model().objects.create_user(username='admin', password='admin', is_staff=True)
+        self.client.force_login(admin)
+        self.content = b'0123456789' * 1000
+
+    def _metadata(self, **fields):
+        return ','.join(f'{key} {base64.b64encode(value.encode()).decode()}' for key, value in fields.items())
+
+    def _create(self):
+        response = self.client.post(
+            reverse('upload-create'),
+            HTTP_UPLOAD_LENGTH=str(len(self.content)),
+            HTTP_UPLOAD_METADATA=self._metadata(filename='resumed.mp4', title='Resumed', category='Nature'),
+        )
+        self.assertEqual(response.status_code, 201)
+        return response['Location']
+
+    def _patch(self, url, offset, data):
+        return self.client.patch(url, data, content_type='application/offset+octet-stream',
+                                 HTTP_UPLOAD_OFFSET=str(offset))
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_upload_resumes_and_creates_video_once(self, get_queue):
+        url = self._create()
+        response = self._patch(url, 0, self.content[:4000])
+        self.assertEqual(response['Upload-Offset'], '4000')
+        self.assertFalse(Video.objects.filter(title='Resumed').exists())
+
+        response = self.client.head(url)
+        self.assertEqual(response['Upload-Offset'], '4000')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self._patch(url, 4000, self.content[4000:])
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(response['Upload-Offset'], str(len(self.content)))
+
+        video = Video.objects.get(title='Resumed')
+        with video.video_file.open('rb') as f:
+            self.assertEqual(f.read(), self.content)
+        self.assertEqual(video.content_hash, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(UploadSession.objects.get().video, video)
+        self.assertEqual(len(transcode_calls(get_queue)), 1)
+
+    def test_offset_mismatch_is_rejected(self):
+        url = self._create()
+        response = self._patch(url, 10, self.content[:10])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '0')
+
+    def test_patch_is_refused_while_another_holds_the_lock(self):
+        url = self._create()
+        lock = f'upload-lock:{UploadSession.objects.get().id}'
+        cache.add(lock, 1)
+        self.addCleanup(cache.delete, lock)
+        response = self._patch(url, 0, self.content)
+        self.assertEqual(response.status_code, 423)
+        self.assertEqual(UploadSession.objects.get().offset, 0)
+
+    def test_offset_is_checked_after_taking_the_lock(self):
+        url = self._create()
+        session = UploadSession.objects.get()
+        add = cache.add
+
+        def finish_other_request(*args, **kwargs):
+            # Another PATCH appended its chunk while this one waited for the lock
+            UploadSession.objects.filter(id=session.id).update(offset=4000)
+            return add(*args, **kwargs)
+
+        with patch('content.views.cache.add', side_effect=finish_other_request):
+            response = self._patch(url, 0, self.content[:4000])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response['Upload-Offset'], '4000')
+        self.assertTrue(cache.add(f'upload-lock:{session.id}', 1))
+
+    def test_upload_requires_staff(self):
+        self.client.logout()
+        response = self.client.post(reverse('upload-create'), HTTP_UPLOAD_LENGTH='10')
+        self.assertEqual(response.status_code, 403)
+
+
+class ArtworkTest(MediaRootTestCase):
+    info = {
+        'format': {'duration': '25.0'},
+        'streams': [{'codec_type': 'video', 'width': 1920, 'height': 1080}],
+    }
+
+    def test_sprite_vtt_maps_time_to_tiles(self):
+        vtt = build_sprite_vtt(self.info).splitlines()
+        self.assertEqual(vtt[0], 'WEBVTT')
+        self.assertEqual(vtt[2], '00:00:00.000 --> 00:00:01.000')
+        self.assertEqual(vtt[3], 'sprite.jpg#xywh=0,0,160,90')
+        self.assertIn('00:00:24.000 --> 00:00:25.000', vtt)
+        self.assertIn('sprite.jpg#xywh=640,180,160,90', vtt)
+
+    def test_artwork_outputs_come_from_the_same_input(self):
+        args = build_artwork_args(1, self.info)
+        self.assertNotIn('-i', args)
+        self.assertTrue(args[-1].endswith('videos/images/1/sprite.jpg'))
+        self.assertIn('fps=1/1,scale=160:90,tile=10x10', args)
+
+
+class TranscodeStateTest(MediaRootTestCase):
+
+    @patch('content.signals.django_rq.get_queue')
+    def setUp(self, get_queue):
+        super().setUp()
+        self.video = Video.objects.create(title='State', description='State machine', category='Food',
+                                          video_file=SimpleUploadedFile('state.mp4', b'state bytes'))
+
+    def test_new_video_is_pending(self):
+        self.assertEqual(self.video.status, Video.Status.PENDING)
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_metadata_edit_is_one_update_without_jobs(self, get_queue):
+        self.video.title = 'Renamed'
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            self.video.save()
+        self.assertEqual(transcode_calls(get_queue), [])
+
+    def test_video_is_claimed_only_once(self):
+        self.assertTrue(claim_video(self.video.id))
+        self.assertFalse(claim_video(self.video.id))
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.status, Video.Status.ENCODING)
+
+    def test_encoding_video_of_a_killed_worker_is_taken_over_after_the_lease(self):
+        self.assertTrue(claim_video(self.video.id))
+        self.assertFalse(claim_video(self.video.id))
+
+        # The worker was killed mid-encode; no failure callback ran
+        expired = timezone.now() - timedelta(seconds=settings.VIDEO_CLAIM_LEASE + 1)
+        Video.objects.filter(id=self.video.id).update(claimed_at=expired)
+        self.assertTrue(claim_video(self.video.id))
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.status, Video.Status.ENCODING)
+        self.assertGreater(self.video.claimed_at, expired)
+
+    @patch('content.tasks.probe')
+    def test_redelivered_job_does_nothing(self, probe):
+        Video.objects.filter(id=self.video.id).update(status=Video.Status.READY)
+        transcode_video(self.video.video_file.path, self.video.id)
+        probe.assert_not_called()
+
+    def test_failed_job_marks_video_failed_and_can_be_retried(self):
+        claim_video(self.video.id)
+        job = type('Job', (), {'args': (self.video.video_file.path, self.video.id)})()
+        mark_failed(job, None, RuntimeError, RuntimeError('ffmpeg'), None)
+        self.video.refresh_from_db()
+        self.assertEqual(self.video.status, Video.Status.FAILED)
+        self.assertTrue(claim_video(self.video.id))
+
+
+class MediaFileViewTest(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(settings.MEDIA_ROOT, 'videos', 'range_test.mp4')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as f:
+            f.write(b'0123456789')
+        self.url = reverse('media', args=['videos/range_test.mp4'])
+
+    def test_full_file(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'video/mp4')
+
+    def test_byte_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), b'2345')
+        self.assertEqual(response['Content-Range'], 'bytes 2-5/10')
+        self.assertEqual(response['Content-Length'], '4')
+
+    def test_suffix_and_open_ended_ranges(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-3')
+        self.assertEqual(b''.join(response.streaming_content), b'789')
+        response = self.client.get(self.url, HTTP_RANGE='bytes=8-')
+        self.assertEqual(b''.join(response.streaming_content), b'89')
+
+    def test_unsatisfiable_range(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=20-30')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */10')
+
+    def test_path_outside_media_root(self):
+        response = self.client.get(reverse('media', args=['../manage.py']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_conditional_request(self):
+        response = self.client.get(self.url)
+        self.assertIn('Last-Modified', response)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    @patch('content.views.MEDIA_ACCEL', 'x-accel-redirect')
+    def test_transfer_is_handed_to_proxy(self):
+        response = self.client.get(self.url, HTTP_RANGE='bytes=2-5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/videos/range_test.mp4')
+        self.assertEqual(response.content, b'')
+
+
+class CatalogConditionalGetTest(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.url = reverse('video-list')
+
+    def test_unchanged_catalog_is_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_changed_catalog_gets_new_etag(self, get_queue):
+        etag = self.client.get(self.url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(title='New', description='New video', category='Food',
+                                 video_file=SimpleUploadedFile('etag.mp4', b'etag bytes'))
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual([video['title'] for video in response.json()['results']], ['New'])
+
+
+class CatalogCacheTest(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_change_bumps_version_and_schedules_refresh(self, get_queue):
+        version = get_catalog_version()['version']
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(title='Fresh', description='Fresh video', category='Food',
+                                 video_file=SimpleUploadedFile('fresh.mp4', b'fresh bytes'))
+        self.assertNotEqual(get_catalog_version()['version'], version)
+        jobs = [c.args[0] for c in get_queue.return_value.enqueue.call_args_list]
+        self.assertIn(refresh_catalog, jobs)
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_refreshed_list_is_served_without_queries(self, get_queue):
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(title='Warm', description='Warm video', category='Food',
+                                 video_file=SimpleUploadedFile('warm.mp4', b'warm bytes'))
+        refresh_catalog()
+        self.assertIsNotNone(cache.get(catalog_cache_key(get_catalog_version()['version'])))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('video-list'))
+        self.assertEqual([video['title'] for video in response.json()['results']], ['Warm'])
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_concurrent_miss_gets_stale_list_while_lock_is_held(self, get_queue):
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(title='Old', description='Old video', category='Food',
+                                 video_file=SimpleUploadedFile('old.mp4', b'old bytes'))
+        old_version, _ = get_catalog_payload()
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(title='New', description='New video', category='Food',
+                                 video_file=SimpleUploadedFile('new.mp4', b'new bytes'))
+        version = get_catalog_version()['version']
+        cache.add(catalog_lock_key(version), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('video-list'))
+        self.assertEqual([video['title'] for video in response.json()['results']], ['Old'])
+        self.assertTrue(response['ETag'].startswith(f'"{old_version}-'))
+        self.assertNotIn('Last-Modified', response)
+        self.assertIn('stale-while-revalidate', response['Cache-Control'])
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_failed_render_serves_stale_list(self, get_queue):
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(title='Old', description='Old video', category='Food',
+                                 video_file=SimpleUploadedFile('old.mp4', b'old bytes'))
+        old_version, old_payload = get_catalog_payload()
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(title='New', description='New video', category='Food',
+                                 video_file=SimpleUploadedFile('new.mp4', b'new bytes'))
+        with patch('content.catalog.render_catalog', side_effect=RuntimeError('db down')), \
+                self.assertLogs('content.catalog', 'ERROR'):
+            self.assertEqual(get_catalog_payload(), (old_version, old_payload))
+        version = get_catalog_version()['version']
+        self.assertTrue(cache.add(catalog_lock_key(version), 1))
+
+    @patch('content.catalog.render_catalog', return_value=b'[]')
+    def test_refresh_skips_when_another_render_holds_the_lock(self, render_catalog):
+        cache.add(catalog_lock_key(get_catalog_version()['version']), 1)
+        refresh_catalog()
+        render_catalog.assert_not_called()
+
+
+class CatalogPaginationTest(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for day in range(1, 6):
+            for category in ('Food', 'Sports'):
+                Video.objects.create(title=f'{category} {day}', description='', category=category,
+                                     created_at=date(2024, 1, day), status=Video.Status.READY)
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('video-list')
+
+    def titles(self, response):
+        return [video['title'] for video in response.json()['results']]
+
+    def test_pages_follow_the_cursor_newest_first(self):
+        response = self.client.get(self.url, {'page_size': 4})
+        seen = self.titles(response)
+        self.assertEqual(seen[:2], ['Sports 5', 'Food 5'])
+        while response.json()['next']:
+            response = self.client.get(response.json()['next'])
+            seen += self.titles(response)
+        self.assertEqual(len(seen), 10)
+        self.assertEqual(len(set(seen)), 10)
+
+    def test_category_is_filtered_on_the_server(self):
+        response = self.client.get(self.url, {'category': 'Food', 'page_size': 3})
+        self.assertEqual(self.titles(response), ['Food 5', 'Food 4', 'Food 3'])
+        response = self.client.get(response.json()['next'])
+        self.assertEqual(self.titles(response), ['Food 2', 'Food 1'])
+        self.assertIsNone(response.json()['next'])
+
+    def test_deep_page_uses_keyset_filter_not_offset(self):
+        cursor = encode_cursor(Video.objects.get(title='Food 2'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, {'cursor': cursor})
+        self.assertEqual(self.titles(response), ['Sports 1', 'Food 1'])
+        self.assertNotIn('OFFSET', queries.captured_queries[0]['sql'].upper())
+
+    def test_invalid_cursor_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'cursor': 'not-a-cursor'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'page_size': 1000}).status_code, 400)
+
+
+class BrowseRowsTest(MediaRootTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        for day in range(1, 4):
+            Video.objects.create(title=f'Food {day}', description='', category='Food', created_at=date(2024, 1, day))
+        Video.objects.create(title='Nature 1', description='', category='Nature', created_at=date(2024, 1, 1))
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.url = reverse('video-browse')
+
+    @patch('content.catalog.CATALOG_BROWSE_ROW_SIZE', 2)
+    def test_rows_hold_counts_and_newest_videos_per_category(self):
+        with self.assertNumQueries(3):
+            refresh_browse()
+        rows = self.client.get(self.url).json()
+        self.assertEqual([(row['category'], row['count']) for row in rows], [('Food', 3), ('Nature', 1)])
+        self.assertEqual([video['title'] for video in rows[0]['videos']], ['Food 3', 'Food 2'])
+
+    def test_rows_are_served_from_the_materialized_view(self):
+        refresh_browse()
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    @patch('content.signals.django_rq.get_queue')
+    def test_catalog_refresh_rebuilds_rows(self, get_queue):
+        refresh_browse()
+        with self.captureOnCommitCallbacks(execute=True):
+            Video.objects.create(title='Animals 1', description='', category='Animals',
+                                 video_file=SimpleUploadedFile('animals.mp4', b'animal bytes'))
+        refresh_catalog()
+        self.assertEqual(cache.get(CATALOG_BROWSE_KEY)['version'], get_catalog_version()['version'])
+        self.assertEqual(self.client.get(self.url).json()[0]['category'], 'Animals')
+
+
+class VideoFragmentTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.video = Video.objects.create(title='Fragment', description='Fragment video', category='Food',
+                                          video_file='videos/fragment.mp4', video_480p='videos/480p/fragment_480p.mp4')
+        Rendition.objects.create(video=self.video, profile='480p', file='videos/480p/fragment_480p.mp4')
+
+    def test_fragment_matches_serializer(self):
+        video = Video.objects.prefetch_related('renditions').get()
+        self.assertEqual(json.loads(get_fragments([video], fragment_snapshot())[0]),
+                         json.loads(json.dumps(VideoSerializer(video).data)))
+        self.assertEqual(list(video_data(video)), list(VideoSerializer(video).data))
+        self.assertNotIn('claimed_at', video_data(video))
+
+    def test_fragments_are_reused_until_the_video_changes(self):
+        get_fragments(list(Video.objects.prefetch_related('renditions')), fragment_snapshot())
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('video-list'))
+        self.assertEqual(response.json()['results'][0]['title'], 'Fragment')
+        with patch('content.signals.django_rq.get_queue') as get_queue, self.captureOnCommitCallbacks(execute=True):
+            Video.objects.filter(pk=self.video.pk).update(title='Renamed')
+            mark_ready(self.video.pk)
+        self.assertIn(refresh_catalog, [c.args[0] for c in get_queue.return_value.enqueue.call_args_list])
+        self.assertEqual(get_revisions([self.video.pk]), {self.video.pk: 1})
+        self.assertEqual(self.client.get(reverse('video-list')).json()['results'][0]['title'], 'Renamed')
+
+    def test_fragment_is_rendered_when_the_video_is_saved(self):
+        with patch('content.signals.django_rq.get_queue'), self.captureOnCommitCallbacks(execute=True):
+            self.video.title = 'Saved'
+            self.video.save()
+        revision = get_revisions([self.video.pk])[self.video.pk]
+        self.assertEqual(json.loads(cache.get(fragment_key(self.video.pk, revision)))['title'], 'Saved')
+
+    def test_render_in_flight_does_not_store_a_stale_fragment(self):
+        snapshot = fragment_snapshot()
+        stale = list(Video.objects.prefetch_related('renditions'))
+        Video.objects.filter(pk=self.video.pk).update(title='Renamed')
+        drop_fragment(self.video.pk)
+        get_fragments(stale, snapshot)
+        self.assertIsNone(cache.get(fragment_key(self.video.pk, 1)))
+        self.assertEqual(json.loads(get_fragments(list(Video.objects.prefetch_related('renditions')),
+                                                  fragment_snapshot())[0])['title'], 'Renamed')
+        self.assertIsNotNone(cache.get(fragment_key(self.video.pk, 1)))
+
+
+class AsyncCatalogViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_cached_page_is_served_from_async_redis(self):
+        await sync_to_async(Video.objects.create)(title='Async', description='', category='Food')
+        await sync_to_async(refresh_catalog)()
+        with patch('content.catalog.get_catalog_payload') as get_catalog_payload:
+            response = await self.async_client.get(reverse('video-list'))
+        get_catalog_payload.assert_not_called()
+        self.assertEqual([video['title'] for video in response.json()['results']], ['Async'])
+        response = await self.async_client.get(reverse('video-list'), headers={'if-none-match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_invalid_query_is_rejected(self):
+        response = await self.async_client.get(reverse('video-list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cursor', response.json())
+
+
+    def test_clients_of_per_request_loops_are_closed(self):
+        refresh_catalog()
+        for _ in range(20):
+            self.assertEqual(self.client.get(reverse('video-list')).status_code, 200)
+        self.assertEqual(asynccache._clients, {})
+
+class CatalogCompressionTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        Video.objects.create(title='Compressed', description='Compressed video ' * 20, category='Food')
+        self.url = reverse('video-list')
+
+    def test_gzip_variant_is_served_from_cache(self):
+        refresh_catalog()
+        with patch('content.compression.gzip.compress') as compress:
+            response = self.client.get(self.url, headers={'accept-encoding': 'gzip, deflate'})
+        compress.assert_not_called()
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertTrue(response['ETag'].endswith('-gz"'))
+        self.assertEqual(json.loads(gzip.decompress(response.content))['results'][0]['title'], 'Compressed')
+
+    def test_identity_when_client_sends_no_accept_encoding(self):
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(response.json()['results'][0]['title'], 'Compressed')
+
+    def test_conditional_request_matches_the_encoded_variant(self):
+        etag = self.client.get(self.url, headers={'accept-encoding': 'gzip'})['ETag']
+        response = self.client.get(self.url, headers={'accept-encoding': 'gzip', 'if-none-match': etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.client.get(self.url, headers={'if-none-match': etag}).status_code, 200)
+
+    def test_choose_encoding(self):
+        self.assertEqual(choose_encoding('gzip;q=0, identity', ('gzip', 'identity')), 'identity')
+        self.assertEqual(choose_encoding('br, gzip', ('gzip', 'identity')), 'gzip')
+        self.assertEqual(choose_encoding('br, gzip', ('br', 'gzip', 'identity')), 'br')
+        self.assertEqual(choose_encoding('*', ('br', 'gzip', 'identity')), 'br')
+        self.assertEqual(choose_encoding('', ('gzip', 'identity')), 'identity')
+
+
+@patch('content.signing.MEDIA_URL_SIGNING_KEY', 'test-signing-key')
+class SignedMediaUrlTest(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.path = os.path.join(settings.MEDIA_ROOT, 'videos', 'signed_test.mp4')
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, 'wb') as f:
+            f.write(b'signed bytes')
+
+    def signed_path(self, url):
+        return url[len(settings.MEDIA_URL):]
+
+    def test_signed_url_verifies_until_it_expires(self):
+        now = 1_700_000_000
+        path = self.signed_path(sign_media_url('videos/signed_test.mp4', now=now))
+        self.assertEqual(verify_media_path(path, now=now), 'videos/signed_test.mp4')
+        expires = (now // MEDIA_URL_BUCKET + 1) * MEDIA_URL_BUCKET
+        self.assertIsNotNone(verify_media_path(path, now=expires))
+        self.assertIsNone(verify_media_path(path, now=expires + 24 * 60 * 60))
+        self.assertIsNone(verify_media_path(path.replace('signed_test', 'other_test'), now=now))
+
+    def test_urls_signed_within_a_bucket_are_identical(self):
+        now = 1_700_000_000 // MEDIA_URL_BUCKET * MEDIA_URL_BUCKET
+        self.assertEqual(sign_media_url('videos/a.mp4', now=now),
+                         sign_media_url('videos/a.mp4', now=now + MEDIA_URL_BUCKET - 1))
+
+    def test_stream_token_covers_the_video_directory_only(self):
+        master = self.signed_path(sign_media_url('videos/streams/12/master.m3u8'))
+        segment = master.replace('master.m3u8', 'stream_0/seg_001.m4s')
+        self.assertEqual(verify_media_path(segment), 'videos/streams/12/stream_0/seg_001.m4s')
+        self.assertIsNone(verify_media_path(master.replace('streams/12/', 'streams/13/')))
+        self.assertIsNone(verify_media_path(master.replace('master.m3u8', '../../480p/a.mp4')))
+
+    def test_media_view_requires_a_valid_signature(self):
+        response = self.client.get(reverse('media', args=['videos/signed_test.mp4']))
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(sign_media_url('videos/signed_test.mp4'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), b'signed bytes')
+
+    def test_catalog_serializes_signed_urls(self):
+        Video.objects.create(title='Signed', description='', category='Food', video_480p='videos/480p/signed.mp4')
+        video = self.client.get(reverse('video-list')).json()['results'][0]
+        self.assertTrue(video['video_480p'].startswith(f'{settings.MEDIA_URL}signed/'))
+        self.assertIsNotNone(verify_media_path(self.signed_path(video['video_480p'])))
+
+    def test_catalog_version_rolls_over_with_the_bucket(self):
+        version = get_catalog_version()['version']
+        with patch('content.catalog.media_url_bucket', return_value=int(time.time()) // MEDIA_URL_BUCKET + 1):
+            self.assertNotEqual(get_catalog_version()['version'], version)
+
+    def test_browse_rows_are_rebuilt_by_one_request_at_the_rollover(self):
+        Video.objects.create(title='Rows', description='', category='Food', video_480p='videos/480p/rows.mp4')
+        etag = self.client.get(reverse('video-browse'))['ETag']
+        with patch('content.catalog.media_url_bucket', return_value=int(time.time()) // MEDIA_URL_BUCKET + 1):
+            # Another request holds the lock and rebuilds the rows of the new bucket
+            cache.add(browse_lock_key(), 1)
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse('video-browse'))
+            self.assertEqual(response['ETag'], etag)
+            cache.delete(browse_lock_key())
+            self.assertNotEqual(self.client.get(reverse('video-browse'))['ETag'], etag)
@@ -1,18 +1,410 @@
-from django.shortcuts import render
-
-# Create your views here.
-from rest_framework import generics
-from .models import Video
-from .serializers import VideoSerializer
+import base64
+import binascii
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from .models import UploadSession, Video
+from .progress import get_progress
+from .pagination import parse_catalog_query
+from .compression import ENCODINGS, ETAG_SUFFIXES, choose_encoding
+from .catalog import (CATALOG_STALE_IF_ERROR, CATALOG_STALE_WHILE_REVALIDATE, aget_browse, aget_catalog_payload,
+                      aget_catalog_version, catalog_version_etag)
+from .signing import signing_enabled, verify_media_path
+from .uploadhandlers import file_sha256
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.text import get_valid_filename
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views import View
 from django.conf import settings
-from django.core.cache.backends.base import DEFAULT_TIMEOUT
-from django.views.decorators.cache import cache_page
-from django.utils.decorators import method_decorator
+from django.utils.cache import get_conditional_response, patch_vary_headers
+
+
+
+TUS_VERSION = '1.0.0'
+UPLOAD_READ_SIZE = getattr(settings, 'VIDEO_UPLOAD_READ_SIZE', 64 * 1024)
+UPLOAD_MAX_SIZE = getattr(settings, 'VIDEO_UPLOAD_MAX_SIZE', 5 * 1024 ** 3)
+MEDIA_ACCEL = getattr(settings, 'MEDIA_ACCEL', None)
+MEDIA_ACCEL_PREFIX = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/')
+MEDIA_TYPES = {
+    '.m3u8': 'application/vnd.apple.mpegurl',
+    '.mpd': 'application/dash+xml',
+    '.m4s': 'video/iso.segment',
+    '.ts': 'video/mp2t',
+    '.vtt': 'text/vtt',
+}
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def encoded_response(variants, encoding):
+    """
+    JSON response with the pre-compressed variant for ``encoding``.
+    """
+    response = HttpResponse(variants[encoding], content_type='application/json')
+    if encoding != 'identity':
+        response['Content-Encoding'] = encoding
+    return response
+
+
+class VideoListView(View):
+    """
+    Lists the catalog newest first, one page at a time. ``?category=``
+    filters on the server and ``?cursor=`` (taken from ``next``) continues
+    after the previous page; ``?page_size=`` sets the page length. Clients
+    that send the ETag or Last-Modified of their copy get a 304 as long as
+    the catalog version has not changed, without any query or serialization.
+
+    The JSON is cached under the catalog version and re-rendered in the
+    background whenever a video changes. While a new version is being
+    rendered, readers get the previous list (with that list's ETag and no
+    Last-Modified, so clients revalidate again) instead of all hitting the
+    database at once.
+
+    The view is async: under an ASGI server a cached page is two awaited
+    Redis reads and does not hold a worker thread. Pages are cached
+    pre-compressed and the variant is picked by ``Accept-Encoding``.
+    """
+    async def get(self, request):
+        try:
+            query = parse_catalog_query(request.GET)
+        except ValidationError as e:
+            return JsonResponse(e.detail, status=status.HTTP_400_BAD_REQUEST)
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), ENCODINGS)
+        state = await aget_catalog_version()
+        etag = f'"{catalog_version_etag(request, state["version"])}{ETAG_SUFFIXES[encoding]}"'
+        response = get_conditional_response(request, etag=etag, last_modified=state['modified'])
+        version = state['version']
+        if response is None:
+            version, variants = await aget_catalog_payload(query)
+            response = encoded_response(variants, encoding)
+            etag = f'"{catalog_version_etag(request, version)}{ETAG_SUFFIXES[encoding]}"'
+        patch_vary_headers(response, ['Accept-Encoding'])
+        response['ETag'] = etag
+        if version == state['version']:
+            # A stale list predates the current version; a Last-Modified of that
+            # version would get it a 304 on revalidation, so only its ETag is sent
+            response['Last-Modified'] = http_date(state['modified'])
+        response['Cache-Control'] = (f'max-age=0, stale-while-revalidate={CATALOG_STALE_WHILE_REVALIDATE}, '
+                                     f'stale-if-error={CATALOG_STALE_IF_ERROR}')
+        return response
+
+
+class VideoBrowseView(View):
+    """
+    Returns the home screen rows: per category the video count and the
+    newest videos. The rows are materialized in Redis whenever the catalog
+    changes, so this is one awaited cache read.
+    """
+    async def get(self, request):
+        browse = await aget_browse()
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), ENCODINGS)
+        etag = f'"browse-{browse["version"]}{ETAG_SUFFIXES[encoding]}"'
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = encoded_response(browse['payload'], encoding)
+        patch_vary_headers(response, ['Accept-Encoding'])
+        response['ETag'] = etag
+        return response
+
+
+class VideoProgressView(APIView):
+    """
+    Returns the live transcode progress of a video, one entry per ffmpeg run.
+    """
+    def get(self, request, video_id):
+        if not Video.objects.filter(id=video_id).exists():
+            return Response({"error": "Video not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(get_progress(video_id), status=status.HTTP_200_OK)
+
+
+class ResumableUploadView(APIView):
+    """
+    Creates a resumable upload (tus 1.0 creation extension).
+
+    The client sends ``Upload-Length`` and ``Upload-Metadata`` (``filename``,
+    ``title``, ``description`` and ``category``, base64 encoded) and gets the
+    upload URL back in ``Location``.
+    """
+    permission_classes = [IsAdminUser]
+
+    def options(self, request, *args, **kwargs):
+        return Response(status=status.HTTP_204_NO_CONTENT, headers={
+            'Tus-Resumable': TUS_VERSION,
+            'Tus-Version': TUS_VERSION,
+            'Tus-Extension': 'creation',
+            'Tus-Max-Size': str(UPLOAD_MAX_SIZE),
+        })
+
+    def post(self, request):
+        try:
+            length = int(request.headers.get('Upload-Length', ''))
+            metadata = self._parse_metadata(request.headers.get('Upload-Metadata', ''))
+        except (ValueError, binascii.Error):
+            return Response({"error": "Invalid Upload-Length or Upload-Metadata."}, status=status.HTTP_400_BAD_REQUEST)
+        if length <= 0:
+            return Response({"error": "Invalid Upload-Length."}, status=status.HTTP_400_BAD_REQUEST)
+        if length > UPLOAD_MAX_SIZE:
+            return Response({"error": "Upload is too large."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if not metadata.get('filename') or not metadata.get('title'):
+            return Response({"error": "filename and title are required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        session = UploadSession.objects.create(
+            filename=get_valid_filename(os.path.basename(metadata['filename'])),
+            length=length,
+            title=metadata['title'][:80],
+            description=metadata.get('description', '')[:500],
+            category=metadata.get('category', '')[:40],
+        )
+        os.makedirs(os.path.dirname(session.partial_path), exist_ok=True)
+        open(session.partial_path, 'wb').close()
+        return Response(status=status.HTTP_201_CREATED, headers={
+            'Tus-Resumable': TUS_VERSION,
+            'Location': request.build_absolute_uri(reverse('upload-detail', args=[session.id])),
+            'Upload-Offset': '0',
+        })
+
+    def _parse_metadata(self, header):
+        """
+        Decode a tus ``Upload-Metadata`` header into a dict.
+        """
+        metadata = {}
+        for pair in filter(None, (item.strip() for item in header.split(','))):
+            key, _, value = pair.partition(' ')
+            metadata[key] = base64.b64decode(value, validate=True).decode() if value else ''
+        return metadata
+
+
+class ResumableUploadDetailView(APIView):
+    """
+    Reports the offset of a resumable upload (HEAD) and appends chunks to it
+    (PATCH). Chunks are streamed to disk in small reads so memory use does not
+    depend on the chunk size. The video is created when the last byte arrives,
+    so the post_save pipeline runs exactly once per upload.
+    """
+    permission_classes = [IsAdminUser]
+
+    def head(self, request, upload_id):
+        session = self._get_session(upload_id)
+        if isinstance(session, Response):
+            return session
+        return Response(status=status.HTTP_200_OK, headers=self._offset_headers(session, **{
+            'Upload-Length': str(session.length),
+            'Cache-Control': 'no-store',
+        }))
+
+    def patch(self, request, upload_id):
+        session = self._get_session(upload_id)
+        if isinstance(session, Response):
+            return session
+        if request.content_type != 'application/offset+octet-stream':
+            return Response({"error": "Content-Type must be application/offset+octet-stream."},
+                            status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+        # Offset and completion are checked under the lock on a fresh copy of
+        # the session, so concurrent PATCHes never write over each other
+        lock = f'upload-lock:{session.id}'
+        if not cache.add(lock, 1, timeout=60 * 60):
+            return Response({"error": "Upload is locked by another request."}, status=status.HTTP_423_LOCKED)
+        try:
+            session.refresh_from_db()
+            if session.is_complete:
+                return Response({"error": "Upload is already complete."}, status=status.HTTP_403_FORBIDDEN)
+            if request.headers.get('Upload-Offset') != str(session.offset):
+                return Response({"error": "Upload-Offset does not match."}, status=status.HTTP_409_CONFLICT,
+                                headers=self._offset_headers(session))
+            self._append(request, session)
+            if session.is_complete:
+                self._complete(session)
+        finally:
+            cache.delete(lock)
+        return Response(status=status.HTTP_204_NO_CONTENT, headers=self._offset_headers(session))
+
+    def _get_session(self, upload_id):
+        try:
+            return UploadSession.objects.get(id=upload_id)
+        except UploadSession.DoesNotExist:
+            return Response({"error": "Upload not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    def _offset_headers(self, session, **headers):
+        return {'Tus-Resumable': TUS_VERSION, 'Upload-Offset': str(session.offset), **headers}
+
+    def _append(self, request, session):
+        """
+        Stream the request body onto the partial file.
+
+        Bytes beyond the last recorded offset (left over from a dropped
+        request) are cut off first, and nothing past ``Upload-Length`` is
+        read. The offset is saved even if the client disconnects mid-chunk, so
+        the next PATCH resumes from there.
+        """
+        with open(session.partial_path, 'r+b') as f:
+            f.truncate(session.offset)
+            f.seek(session.offset)
+            try:
+                while session.offset < session.length:
+                    data = request.read(min(UPLOAD_READ_SIZE, session.length - session.offset))
+                    if not data:
+                        break
+                    f.write(data)
+                    session.offset += len(data)
+            finally:
+                UploadSession.objects.filter(id=session.id).update(offset=session.offset)
+
+    def _complete(self, session):
+        """
+        Move the finished file into the media directory and create the video.
+        """
+        name = default_storage.get_available_name(f"videos/{session.filename}")
+        os.makedirs(os.path.dirname(default_storage.path(name)), exist_ok=True)
+        os.replace(session.partial_path, default_storage.path(name))
+        with default_storage.open(name) as f:
+            content_hash = file_sha256(f)
+
+        video = Video.objects.create(
+            title=session.title,
+            description=session.description,
+            category=session.category,
+            video_file=name,
+            content_hash=content_hash,
+        )
+        if video.video_file.name != name:
+            default_storage.delete(name)
+        session.video = video
+        session.save(update_fields=['video'])
+
+
+class MediaFileView(View):
+    """
+    Serves files from ``MEDIA_ROOT`` with HTTP Range support so players can
+    seek without downloading the whole file. Responses carry an ETag and
+    Last-Modified and conditional requests are answered with 304.
+
+    With ``MEDIA_ACCEL`` set to ``'x-accel-redirect'`` (nginx) or
+    ``'x-sendfile'`` (Apache, lighttpd) Django only resolves and checks the
+    file and the front proxy sends the bytes, ranges included. For nginx the
+    internal location must match ``MEDIA_ACCEL_PREFIX``::
+
+        location /protected-media/ {
+            internal;
+            alias /path/to/media/;
+        }
+
+    Signed media URLs (``MEDIA_URL_SIGNING_KEY``) are checked here too, for
+    setups where the proxy does not verify them itself.
+    """
+    block_size = 64 * 1024
+
+    def get(self, request, path):
+        path = self.resolve_path(request, path)
+        if path is None:
+            return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except SuspiciousFileOperation:
+            raise Http404
+        if not os.path.isfile(full_path):
+            raise Http404
+
+        stat = os.stat(full_path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+        if response is None:
+            response = self._file_response(request, path, full_path, stat, etag)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        return response
+
+    def _file_response(self, request, path, full_path, stat, etag):
+        content_type = self._content_type(full_path)
+        if MEDIA_ACCEL:
+            return self._accel_response(path, full_path, content_type)
+
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if if_range and if_range not in (etag, http_date(stat.st_mtime)):
+            range_header = None
+        byte_range = self._parse_range(range_header, stat.st_size)
+        if byte_range is False:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{stat.st_size}'
+        elif byte_range:
+            start, end = byte_range
+            response = StreamingHttpResponse(self._read_range(full_path, start, end),
+                                             status=status.HTTP_206_PARTIAL_CONTENT, content_type=content_type)
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = str(end - start + 1)
+        else:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        return response
+
+    def resolve_path(self, request, path):
+        """
+        Decide if the request may read the file.
+
+        With ``MEDIA_URL_SIGNING_KEY`` set only signed, unexpired URLs are
+        served (the same check the front proxy does, see
+        :mod:`content.signing`); otherwise the catalog is public.
+
+        :return: The path of the file below ``MEDIA_ROOT``, or ``None`` if
+            access is denied.
+        :rtype: str
+        """
+        if not signing_enabled():
+            return path
+        return verify_media_path(path)
+
+    def _content_type(self, full_path):
+        extension = os.path.splitext(full_path)[1].lower()
+        return MEDIA_TYPES.get(extension) or mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+
+    def _accel_response(self, path, full_path, content_type):
+        response = HttpResponse(content_type=content_type)
+        if MEDIA_ACCEL == 'x-accel-redirect':
+            response['X-Accel-Redirect'] = MEDIA_ACCEL_PREFIX + quote(path)
+        else:
+            response['X-Sendfile'] = full_path
+        return response
 
+    def _parse_range(self, header, size):
+        """
+        Parse a single-range ``Range`` header.
 
+        :return: ``(start, end)`` inclusive, ``None`` to send the whole file
+            (no or unsupported header) or ``False`` if the range cannot be
+            satisfied.
+        """
+        match = RANGE_RE.match(header or '')
+        if not match:
+            return None
+        first, last = match.groups()
+        if not first and not last:
+            return None
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return False
+        return start, end
 
-CACHE_TTL = getattr(settings, 'CACHE_TTL', DEFAULT_TIMEOUT)
-@method_decorator(cache_page(CACHE_TTL), name='dispatch')
-class VideoListView(generics.ListAPIView):
-    queryset = Video.objects.all()
-    serializer_class = VideoSerializer
\ No newline at end of file
+    def _read_range(self, full_path, start, end):
+        with open(full_path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                data = f.read(min(self.block_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                yield data
@@ -0,0 +1,191 @@
+import json
+import logging
+import smtplib
+import time
+import uuid
+import django_rq
+from django.conf import settings
+from django.core.cache import cache
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django_redis import get_redis_connection
+from rq import Retry
+
+logger = logging.getLogger(__name__)
+
+MAIL_QUEUE = getattr(settings, 'MAIL_QUEUE', 'email')
+MAIL_BATCH_SIZE = getattr(settings, 'MAIL_BATCH_SIZE', 50)
+MAIL_RETRY_INTERVALS = getattr(settings, 'MAIL_RETRY_INTERVALS', [10, 60, 300, 900])
+MAIL_MAX_ATTEMPTS = getattr(settings, 'MAIL_MAX_ATTEMPTS', 5)
+MAIL_JOB_TIMEOUT = getattr(settings, 'MAIL_JOB_TIMEOUT', 360)
+# The lock outlives the job timeout, so a job is killed before its lock
+# expires and two runs never overlap
+MAIL_LOCK_TIMEOUT = MAIL_JOB_TIMEOUT + 60
+
+# Redis lists of serialized messages, oldest first: waiting for the worker,
+# being sent, and given up on. Failed messages wait for their retry in a
+# sorted set scored by the time they are due.
+OUTBOX_KEY = 'videoflix:mail:outbox'
+PROCESSING_KEY = 'videoflix:mail:processing'
+RETRY_KEY = 'videoflix:mail:retry'
+DEAD_LETTER_KEY = 'videoflix:mail:dead'
+MAIL_LOCK_KEY = 'videoflix:mail:lock'
+
+# Errors of the server or the network, not of a message; they do not count as an attempt
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, smtplib.SMTPHeloError,
+                     smtplib.SMTPAuthenticationError, ConnectionError, TimeoutError)
+
+
+def queue_email(subject, message, recipient_list, html_message=None, from_email=None):
+    """
+    Send an email from the ``email`` queue instead of the request.
+
+    Takes the arguments of ``send_mail``. Once the transaction commits, the
+    message is appended to the outbox and a :func:`send_queued_emails` job
+    is enqueued; a rolled back registration sends nothing.
+    """
+    data = json.dumps({
+        # Tells identical messages apart in the retry set
+        'id': uuid.uuid4().hex,
+        'subject': subject,
+        'body': message,
+        'from_email': from_email or settings.DEFAULT_FROM_EMAIL,
+        'to': list(recipient_list),
+        'html': html_message,
+    })
+
+    def enqueue():
+        get_redis_connection('default').rpush(OUTBOX_KEY, data)
+        queue = django_rq.get_queue(MAIL_QUEUE, autocommit=True)
+        queue.enqueue(send_queued_emails, job_timeout=MAIL_JOB_TIMEOUT,
+                      retry=Retry(max=len(MAIL_RETRY_INTERVALS), interval=MAIL_RETRY_INTERVALS))
+
+    transaction.on_commit(enqueue)
+
+
+class MailDeliveryError(Exception):
+    """
+    Some messages failed and wait for their retry; raised so RQ runs the
+    job again after the next interval of ``MAIL_RETRY_INTERVALS``.
+    """
+
+
+def send_queued_emails():
+    """
+    Job that drains the outbox over as few SMTP connections as possible.
+
+    One job sends at a time (guarded by a lock), with one connection per
+    ``MAIL_BATCH_SIZE`` messages, so the TLS handshake and login are paid per
+    batch instead of per message. Every message is moved into a processing
+    list with ``LMOVE`` before it is sent and removed from it only after it
+    was sent; messages a killed worker left there are put back in front of
+    the outbox by the next run.
+
+    A message that fails is set aside with its attempt counted, and the rest
+    of the outbox is sent. It is due again after the interval of
+    ``MAIL_RETRY_INTERVALS`` for that attempt and only put back in the
+    outbox by the first run after that; after ``MAIL_MAX_ATTEMPTS``
+    attempts, or right away if all its recipients are refused, it goes to
+    the dead-letter list instead. Connection errors fail the job without
+    counting against the message, which stays first in the outbox. In both
+    cases RQ retries the job after the next interval (the worker needs
+    ``--with-scheduler``).
+
+    :return: Number of messages sent.
+    :rtype: int
+    :raises MailDeliveryError: If messages were set aside for a retry.
+    """
+    client = get_redis_connection('default')
+    sent = failed = 0
+    while client.llen(OUTBOX_KEY) or client.llen(PROCESSING_KEY) or client.zcount(RETRY_KEY, '-inf', time.time()):
+        if not cache.add(MAIL_LOCK_KEY, 1, MAIL_LOCK_TIMEOUT):
+            # The job holding the lock sends the messages queued meanwhile
+            break
+        try:
+            _recover(client)
+            while client.llen(OUTBOX_KEY):
+                batch_sent, batch_failed = _send_batch(client)
+                sent, failed = sent + batch_sent, failed + batch_failed
+        finally:
+            cache.delete(MAIL_LOCK_KEY)
+        if failed:
+            raise MailDeliveryError(f'{failed} emails failed and wait for a retry')
+    return sent
+
+
+def _recover(client):
+    """
+    Put messages of a killed run back in front of the outbox, in order, and
+    failed messages that are due for their retry behind it.
+    """
+    while client.lmove(PROCESSING_KEY, OUTBOX_KEY, 'RIGHT', 'LEFT'):
+        pass
+    due = client.zrangebyscore(RETRY_KEY, '-inf', time.time())
+    if due:
+        pipe = client.pipeline()
+        pipe.rpush(OUTBOX_KEY, *due)
+        pipe.zrem(RETRY_KEY, *due)
+        pipe.execute()
+
+
+def _send_batch(client):
+    sent = failed = 0
+    with get_connection(fail_silently=False) as connection:
+        for _ in range(MAIL_BATCH_SIZE):
+            data = client.lmove(OUTBOX_KEY, PROCESSING_KEY, 'LEFT', 'RIGHT')
+            if data is None:
+                break
+            try:
+                sent += connection.send_messages([_build_message(data, connection)])
+            except smtplib.SMTPRecipientsRefused as exc:
+                _dead_letter(client, data, exc)
+            except CONNECTION_ERRORS:
+                client.lmove(PROCESSING_KEY, OUTBOX_KEY, 'RIGHT', 'LEFT')
+                raise
+            except Exception as exc:
+                failed += _set_aside(client, data, exc)
+            else:
+                client.lrem(PROCESSING_KEY, 1, data)
+    return sent, failed
+
+
+def _set_aside(client, data, exc):
+    """
+    Count a failed attempt of a message and set it aside until its retry is
+    due, or move it to the dead-letter list once it used up
+    ``MAIL_MAX_ATTEMPTS``.
+
+    :return: 1 if the message will be retried, else 0.
+    :rtype: int
+    """
+    message = json.loads(data)
+    message['attempts'] = message.get('attempts', 0) + 1
+    if message['attempts'] >= MAIL_MAX_ATTEMPTS:
+        _dead_letter(client, data, exc, message)
+        return 0
+    logger.warning('Sending email to %s failed (attempt %s): %s', message['to'], message['attempts'], exc)
+    delay = MAIL_RETRY_INTERVALS[min(message['attempts'], len(MAIL_RETRY_INTERVALS)) - 1]
+    pipe = client.pipeline()
+    pipe.zadd(RETRY_KEY, {json.dumps(message): time.time() + delay})
+    pipe.lrem(PROCESSING_KEY, 1, data)
+    pipe.execute()
+    return 1
+
+
+def _dead_letter(client, data, exc, message=None):
+    message = message or json.loads(data)
+    logger.error('Giving up on email to %s: %s', message['to'], exc)
+    message['error'] = repr(exc)
+    pipe = client.pipeline()
+    pipe.rpush(DEAD_LETTER_KEY, json.dumps(message))
+    pipe.lrem(PROCESSING_KEY, 1, data)
+    pipe.execute()
+
+
+def _build_message(data, connection):
+    data = json.loads(data)
+    message = EmailMultiAlternatives(data['subject'], data['body'], data['from_email'], data['to'],
+                                     connection=connection)
+    if data['html']:
+        message.attach_alternative(data['html'], 'text/html')
+    return message
@@ -0,0 +1,361 @@
+from asgiref.sync import sync_to_async
+from django.db import connection, transaction
+from django.db.models import Count, Exists, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django_redis import get_redis_connection
+from redis.exceptions import WatchError
+from content.asynccache import get_async_redis
+from content.models import Video
+from users.models import CustomUser
+
+# The auto-created through table of CustomUser.favorite_videos, unique on (customuser_id, video_id)
+Favorite = CustomUser.favorite_videos.through
+
+ADD = 'add'
+REMOVE = 'remove'
+FAVORITE_BULK_MAX_OPERATIONS = 500
+
+FAVORITES_KEY = 'videoflix:favorites:{}'
+FAVORITES_TTL = 60 * 60 * 24
+# Member that marks a set as complete; video ids start at 1
+FAVORITES_SENTINEL = 0
+FAVORITES_LOAD_ATTEMPTS = 3
+
+POPULARITY_KEY = 'videoflix:popularity'
+POPULARITY_MAX_LIMIT = 100
+# Member that marks the ranking as complete; it scores below every video
+POPULARITY_SENTINEL = 0
+
+
+def toggle_favorite(user_id, video_id):
+    """
+    Add the video to the user's favorites, or remove it if it is one already.
+
+    Works on the through table by ``(customuser_id, video_id)`` without
+    loading the user, the video or the other favorites. Removing is a single
+    conditional DELETE; only if nothing was deleted the row is inserted,
+    after one query that checks both ids exist.
+
+    :return: ``True`` if the video was added, ``False`` if it was removed.
+    :rtype: bool
+    :raises CustomUser.DoesNotExist: If there is no such user.
+    :raises Video.DoesNotExist: If there is no such video.
+    """
+    with transaction.atomic():
+        deleted, _ = Favorite.objects.filter(customuser_id=user_id, video_id=video_id).delete()
+        if deleted:
+            write_through(user_id, removed=[video_id])
+            count_favorites([video_id], -1)
+            return False
+        video_exists = (CustomUser.objects.filter(id=user_id)
+                        .annotate(video_exists=Exists(Video.objects.filter(id=video_id)))
+                        .values_list('video_exists', flat=True).first())
+        if video_exists is None:
+            raise CustomUser.DoesNotExist
+        if not video_exists:
+            raise Video.DoesNotExist
+        if _insert_favorites(user_id, [video_id]):
+            # Not counted when a concurrent toggle inserted it first
+            write_through(user_id, added=[video_id])
+            count_favorites([video_id], 1)
+        return True
+
+
+def apply_favorites(user_id, operations):
+    """
+    Apply many add/remove operations for one user in one transaction.
+
+    Later operations on the same video win. All removals are one DELETE and
+    all additions one INSERT; additions of favorites that already exist and
+    of unknown videos, and removals of non-favorites are skipped. Both
+    statements return the rows they actually changed, so only those are
+    written through and counted, also under concurrent changes.
+
+    :param operations: Iterable of ``(action, video_id)`` pairs, ``action``
+        being :data:`ADD` or :data:`REMOVE`.
+    :return: Ids of the videos actually added and removed.
+    :rtype: dict
+    :raises CustomUser.DoesNotExist: If there is no such user.
+    """
+    final = {}
+    for action, video_id in operations:
+        final[video_id] = action
+    add = [video_id for video_id, action in final.items() if action == ADD]
+    remove = [video_id for video_id, action in final.items() if action == REMOVE]
+
+    with transaction.atomic():
+        if not CustomUser.objects.filter(id=user_id).exists():
+            raise CustomUser.DoesNotExist
+        remove = _delete_favorites(user_id, remove)
+        if add:
+            add = _insert_favorites(user_id, list(Video.objects.filter(id__in=add).values_list('id', flat=True)))
+        write_through(user_id, added=add, removed=remove)
+        count_favorites(add, 1)
+        count_favorites(remove, -1)
+    return {'added': sorted(add), 'removed': sorted(remove)}
+
+
+def _insert_favorites(user_id, video_ids):
+    """
+    Insert favorites with one ``INSERT ... ON CONFLICT DO NOTHING``,
+    skipping the ones that exist already, also if inserted concurrently.
+
+    :return: Ids of the videos actually inserted.
+    :rtype: list
+    """
+    if not video_ids:
+        return []
+    table, user_column, video_column = _favorite_columns()
+    values = ', '.join(['(%s, %s)'] * len(video_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {table} ({user_column}, {video_column}) VALUES {values} '
+                       f'ON CONFLICT DO NOTHING RETURNING {video_column}',
+                       [value for video_id in video_ids for value in (user_id, video_id)])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _delete_favorites(user_id, video_ids):
+    """
+    Delete favorites with one ``DELETE ... RETURNING``.
+
+    :return: Ids of the videos actually removed.
+    :rtype: list
+    """
+    if not video_ids:
+        return []
+    table, user_column, video_column = _favorite_columns()
+    placeholders = ', '.join(['%s'] * len(video_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE {user_column} = %s AND {video_column} IN ({placeholders}) '
+                       f'RETURNING {video_column}', [user_id, *video_ids])
+        return [row[0] for row in cursor.fetchall()]
+
+
+def _favorite_columns():
+    quote = connection.ops.quote_name
+    return (quote(Favorite._meta.db_table), quote(Favorite._meta.get_field('customuser').column),
+            quote(Favorite._meta.get_field('video').column))
+
+
+def favorites_key(user_id):
+    return FAVORITES_KEY.format(user_id)
+
+
+def favorites_version_key(user_id):
+    """
+    Counter moved by every write-through and drop, even one that does not
+    change the set, so :func:`load_favorites` notices it.
+    """
+    return f'{favorites_key(user_id)}:version'
+
+
+def load_favorites(user_id):
+    """
+    Rebuild the Redis set of a user's favorites from the database.
+
+    The set always holds :data:`FAVORITES_SENTINEL`, so a user without
+    favorites is cached too and a set that only received write-through
+    updates (see :func:`write_through`) is recognized as incomplete.
+
+    The set and its version are watched from before the database is read.
+    If a write-through or a drop happens meanwhile, the snapshot may predate
+    that change and the rebuild is started over; after ``FAVORITES_LOAD_ATTEMPTS`` the
+    snapshot is returned without caching it.
+
+    :return: The ids of the favorite videos.
+    :rtype: set
+    :raises CustomUser.DoesNotExist: If there is no such user.
+    """
+    key = favorites_key(user_id)
+    with get_redis_connection('default').pipeline() as pipe:
+        for _ in range(FAVORITES_LOAD_ATTEMPTS):
+            pipe.watch(key, favorites_version_key(user_id))
+            video_ids = _read_favorites(user_id)
+            pipe.multi()
+            pipe.delete(key)
+            pipe.sadd(key, FAVORITES_SENTINEL, *video_ids)
+            pipe.expire(key, FAVORITES_TTL)
+            try:
+                pipe.execute()
+            except WatchError:
+                continue
+            break
+    return video_ids
+
+
+def _read_favorites(user_id):
+    if not CustomUser.objects.filter(id=user_id).exists():
+        raise CustomUser.DoesNotExist
+    return set(Favorite.objects.filter(customuser_id=user_id).values_list('video_id', flat=True))
+
+
+def get_favorite_ids(user_id):
+    """
+    Return the ids of a user's favorite videos; one SMEMBERS when cached.
+
+    :rtype: set
+    :raises CustomUser.DoesNotExist: If there is no such user.
+    """
+    members = get_redis_connection('default').smembers(favorites_key(user_id))
+    return _members(members) if _is_complete(members) else load_favorites(user_id)
+
+
+async def aget_favorite_ids(user_id):
+    """
+    Async :func:`get_favorite_ids`; only a miss touches the database.
+    """
+    members = await get_async_redis().smembers(favorites_key(user_id))
+    if _is_complete(members):
+        return _members(members)
+    return await sync_to_async(load_favorites)(user_id)
+
+
+async def ais_favorite(user_id, video_id):
+    """
+    Whether a video is one of a user's favorites; one SMISMEMBER when cached.
+
+    :rtype: bool
+    :raises CustomUser.DoesNotExist: If there is no such user.
+    """
+    complete, member = await get_async_redis().smismember(favorites_key(user_id), [FAVORITES_SENTINEL, video_id])
+    if complete:
+        return bool(member)
+    return video_id in await sync_to_async(load_favorites)(user_id)
+
+
+def write_through(user_id, added=(), removed=()):
+    """
+    Apply a change to the cached set once the transaction commits.
+
+    Writes blindly instead of checking that the set exists first; a set
+    created this way lacks the sentinel and is rebuilt on the next read.
+    """
+    if not added and not removed:
+        return
+
+    def write():
+        key = favorites_key(user_id)
+        pipe = get_redis_connection('default').pipeline()
+        if removed:
+            pipe.srem(key, *removed)
+        if added:
+            pipe.sadd(key, *added)
+        pipe.expire(key, FAVORITES_TTL)
+        pipe.incr(favorites_version_key(user_id))
+        pipe.expire(favorites_version_key(user_id), FAVORITES_TTL)
+        pipe.execute()
+
+    transaction.on_commit(write)
+
+
+def drop_favorites(*user_ids):
+    """
+    Forget the cached sets of these users, e.g. after changes that bypass
+    :func:`toggle_favorite` and :func:`apply_favorites`.
+    """
+    if not user_ids:
+        return
+
+    def drop():
+        pipe = get_redis_connection('default').pipeline()
+        pipe.delete(*map(favorites_key, user_ids))
+        for user_id in user_ids:
+            pipe.incr(favorites_version_key(user_id))
+            pipe.expire(favorites_version_key(user_id), FAVORITES_TTL)
+        pipe.execute()
+
+    transaction.on_commit(drop)
+
+
+def count_favorites(video_ids, delta):
+    """
+    Move the favorite counts of videos by ``delta``: the ``favorite_count``
+    column in the current transaction and the Redis ranking once it commits.
+
+    Increments written to a ranking that does not exist yet create one
+    without the sentinel, which :func:`get_popular` rebuilds.
+    """
+    if not video_ids:
+        return
+    videos = Video.objects.filter(id__in=video_ids)
+    if delta < 0:
+        videos = videos.filter(favorite_count__gte=-delta)
+    videos.update(favorite_count=F('favorite_count') + delta)
+
+    def write():
+        pipe = get_redis_connection('default').pipeline()
+        for video_id in video_ids:
+            pipe.zincrby(POPULARITY_KEY, delta, video_id)
+        pipe.execute()
+
+    transaction.on_commit(write)
+
+
+def drop_popularity(video_id):
+    """
+    Remove a deleted video from the Redis ranking once the deletion commits.
+    """
+    transaction.on_commit(lambda: get_redis_connection('default').zrem(POPULARITY_KEY, video_id))
+
+
+def load_popularity():
+    """
+    Rebuild the Redis ranking from the ``favorite_count`` column.
+
+    The new ranking is written under a temporary key and renamed over the
+    old one, so readers never see it half built.
+    """
+    counts = dict(Video.objects.filter(favorite_count__gt=0).values_list('id', 'favorite_count'))
+    counts[POPULARITY_SENTINEL] = -1
+    connection = get_redis_connection('default')
+    building = f'{POPULARITY_KEY}:building'
+    pipe = connection.pipeline()
+    pipe.delete(building)
+    pipe.zadd(building, counts)
+    pipe.rename(building, POPULARITY_KEY)
+    pipe.execute()
+
+
+async def aget_popular(limit):
+    """
+    Return the most favorited videos from the Redis ranking, O(log n + limit).
+
+    :return: ``(video id, favorite count)`` pairs, most favorited first.
+    :rtype: list
+    """
+    async with get_async_redis().pipeline(transaction=False) as pipe:
+        pipe.zscore(POPULARITY_KEY, POPULARITY_SENTINEL)
+        pipe.zrevrangebyscore(POPULARITY_KEY, '+inf', 1, start=0, num=limit, withscores=True)
+        complete, ranking = await pipe.execute()
+    if complete is None:
+        await sync_to_async(load_popularity)()
+        ranking = await get_async_redis().zrevrangebyscore(POPULARITY_KEY, '+inf', 1, start=0, num=limit,
+                                                           withscores=True)
+    return [(int(member), int(score)) for member, score in ranking]
+
+
+def reconcile_favorite_counts():
+    """
+    Job that fixes drift of the favorite counts: recounts the through table,
+    corrects the rows whose ``favorite_count`` differs and rebuilds the
+    Redis ranking. Run it periodically (``manage.py reconcile_favorites``).
+
+    :return: Number of videos whose count was corrected.
+    :rtype: int
+    """
+    actual = Coalesce(Subquery(Favorite.objects.filter(video_id=OuterRef('pk')).values('video_id')
+                               .annotate(count=Count('*')).values('count')), 0)
+    drifted = list(Video.objects.annotate(actual=actual).exclude(favorite_count=F('actual'))
+                   .values_list('id', 'actual'))
+    for video_id, count in drifted:
+        Video.objects.filter(id=video_id).update(favorite_count=count)
+    load_popularity()
+    return len(drifted)
+
+
+def _is_complete(members):
+    return str(FAVORITES_SENTINEL).encode() in members
+
+
+def _members(members):
+    return {int(member) for member in members} - {FAVORITES_SENTINEL}
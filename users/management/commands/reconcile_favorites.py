@@ -0,0 +1,20 @@
+import django_rq
+from django.core.management.base import BaseCommand
+from users.favorites import reconcile_favorite_counts
+
+
+class Command(BaseCommand):
+    help = ('Recounts the favorites of every video, fixes drifted favorite counts and rebuilds the '
+            'popularity ranking. Run it periodically, e.g. hourly from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--enqueue', action='store_true',
+                            help='Run the reconcile job on the default queue instead of in this process')
+
+    def handle(self, *args, **options):
+        if options['enqueue']:
+            django_rq.get_queue('default').enqueue(reconcile_favorite_counts, job_id='reconcile-favorites')
+            self.stdout.write('Reconcile job enqueued.')
+            return
+        corrected = reconcile_favorite_counts()
+        self.stdout.write(self.style.SUCCESS(f'Favorite counts reconciled, {corrected} corrected.'))
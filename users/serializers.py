@@ -2,6 +2,7 @@ from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from django.utils.encoding import force_bytes, force_str
 from content.serializers import VideoSerializer
+from .favorites import ADD, FAVORITE_BULK_MAX_OPERATIONS, REMOVE
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.contrib.auth.tokens import default_token_generator
 
@@ -56,4 +57,14 @@ class SetNewPasswordSerializer(serializers.Serializer):
         return {
             'user': user,
             'new_password': new_password
-        }
\ No newline at end of file
+        }
+
+
+class FavoriteOperationSerializer(serializers.Serializer):
+    video_id = serializers.IntegerField(min_value=1)
+    action = serializers.ChoiceField(choices=[ADD, REMOVE])
+
+
+class FavoriteBulkSerializer(serializers.Serializer):
+    user_id = serializers.IntegerField(min_value=1)
+    operations = FavoriteOperationSerializer(many=True, allow_empty=False, max_length=FAVORITE_BULK_MAX_OPERATIONS)
@@ -0,0 +1,37 @@
+from django.db.models.signals import m2m_changed, post_delete, pre_delete
+from django.dispatch import receiver
+from content.models import Video
+from users.favorites import Favorite, drop_favorites, drop_popularity
+from users.models import CustomUser
+
+
+@receiver(m2m_changed, sender=Favorite)
+def favorites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Drop the cached favorites of users whose favorites were changed through
+    the relation (admin, ``user.favorite_videos.add``) instead of the
+    write-through functions in ``users.favorites``.
+    """
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        drop_favorites(instance.pk)
+    elif action == 'pre_clear':
+        drop_favorites(*Favorite.objects.filter(video_id=instance.pk).values_list('customuser_id', flat=True))
+    else:
+        drop_favorites(*pk_set)
+
+
+@receiver(pre_delete, sender=Video)
+def video_pre_delete(sender, instance, **kwargs):
+    """
+    Favorites of a deleted video disappear by cascade, without m2m signals.
+    The video also leaves the popularity ranking.
+    """
+    drop_favorites(*Favorite.objects.filter(video_id=instance.pk).values_list('customuser_id', flat=True))
+    drop_popularity(instance.pk)
+
+
+@receiver(post_delete, sender=CustomUser)
+def user_post_delete(sender, instance, **kwargs):
+    drop_favorites(instance.pk)
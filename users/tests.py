@@ -1,12 +1,25 @@
+import json
+import smtplib
+import time
 from unittest.mock import patch
 from django.test import TestCase, Client
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from django.core import mail
+from django.core.mail import get_connection
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django_redis import get_redis_connection
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from django.contrib.auth.tokens import default_token_generator
 from content.models import Video
+from content.tests import MediaRootTestCase
+from users.emails import (DEAD_LETTER_KEY, MAIL_JOB_TIMEOUT, MAIL_LOCK_KEY, MAIL_LOCK_TIMEOUT, MAIL_MAX_ATTEMPTS,
+                          MAIL_RETRY_INTERVALS, OUTBOX_KEY, PROCESSING_KEY, RETRY_KEY, MailDeliveryError, queue_email,
+                          send_queued_emails)
+from users import favorites
+from users.favorites import ADD, REMOVE, apply_favorites, get_favorite_ids, load_favorites, load_popularity, reconcile_favorite_counts, toggle_favorite
 from django.core.files.uploadedfile import SimpleUploadedFile
 
 User = get_user_model()
@@ -34,6 +47,146 @@ class UserRegistrationViewTest(TestCase):
         self.assertTrue(User.objects.filter(username='testuser').exists())
 
 
+class EmailQueueTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.redis = get_redis_connection('default')
+        self.user = User.objects.create_user(username='mailuser@example.com', email='mailuser@example.com',
+                                             password='password123', is_active=False)
+
+    def queue(self, count):
+        with patch('users.emails.django_rq.get_queue') as get_queue, self.captureOnCommitCallbacks(execute=True):
+            for index in range(count):
+                queue_email(f'Subject {index}', 'Plain', ['someone@example.com'], html_message='<p>Html</p>')
+        return get_queue
+
+    def test_registration_queues_activation_email(self):
+        data = {'username': 'new@example.com', 'password': 'password123', 'email': 'new@example.com',
+                'first_name': 'Jad', 'last_name': 'LaLa'}
+        with patch('users.emails.django_rq.get_queue') as get_queue, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('register'), data, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(mail.outbox, [])
+        get_queue.assert_called_once_with('email', autocommit=True)
+        _, kwargs = get_queue.return_value.enqueue.call_args
+        self.assertEqual(kwargs['retry'].intervals, [10, 60, 300, 900])
+        self.assertGreater(MAIL_LOCK_TIMEOUT, kwargs['job_timeout'])
+        self.assertEqual(kwargs['job_timeout'], MAIL_JOB_TIMEOUT)
+
+        self.assertEqual(send_queued_emails(), 1)
+        message = mail.outbox[0]
+        self.assertEqual(message.subject, 'Activate Your Account')
+        self.assertEqual(message.to, ['new@example.com'])
+        self.assertEqual(message.alternatives[0][1], 'text/html')
+
+    def test_resend_and_reset_are_queued(self):
+        with patch('users.emails.django_rq.get_queue'), self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('resend-activation'), {'username': self.user.username},
+                             content_type='application/json')
+            self.client.post(reverse('password_reset_request'), {'email': self.user.email},
+                             content_type='application/json')
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(send_queued_emails(), 2)
+        self.assertEqual([message.subject for message in mail.outbox],
+                         ['Activate Your Account', 'Password Reset Request'])
+
+    def test_batch_shares_one_connection(self):
+        self.queue(3)
+        with patch('users.emails.get_connection', wraps=get_connection) as connect:
+            self.assertEqual(send_queued_emails(), 3)
+        connect.assert_called_once()
+        self.assertEqual([message.subject for message in mail.outbox], ['Subject 0', 'Subject 1', 'Subject 2'])
+        self.assertEqual(send_queued_emails(), 0)
+
+    def test_failed_send_keeps_the_rest_for_the_retry(self):
+        self.queue(3)
+        send = locmem.EmailBackend.send_messages
+        with patch.object(locmem.EmailBackend, 'send_messages', autospec=True,
+                          side_effect=[1, ConnectionError('smtp down')]):
+            with self.assertRaises(ConnectionError):
+                send_queued_emails()
+        with patch.object(locmem.EmailBackend, 'send_messages', autospec=True, side_effect=send):
+            self.assertEqual(send_queued_emails(), 2)
+        self.assertEqual([message.subject for message in mail.outbox], ['Subject 1', 'Subject 2'])
+
+
+    def test_failing_message_does_not_block_the_outbox(self):
+        self.queue(3)
+        send = locmem.EmailBackend.send_messages
+
+        def refuse_first(backend, messages):
+            if messages[0].subject == 'Subject 0':
+                raise smtplib.SMTPDataError(554, b'Message rejected')
+            return send(backend, messages)
+
+        now = time.time()
+        with patch.object(locmem.EmailBackend, 'send_messages', autospec=True, side_effect=refuse_first), \
+                patch('users.emails.time') as clock, self.assertLogs('users.emails', 'WARNING'):
+            for attempt in range(1, MAIL_MAX_ATTEMPTS):
+                clock.time.return_value = now
+                with self.assertRaises(MailDeliveryError):
+                    send_queued_emails()
+                [(data, due)] = self.redis.zrange(RETRY_KEY, 0, -1, withscores=True)
+                self.assertEqual(json.loads(data)['attempts'], attempt)
+                self.assertEqual(due, now + MAIL_RETRY_INTERVALS[attempt - 1])
+                now = due
+            clock.time.return_value = now
+            self.assertEqual(send_queued_emails(), 0)
+        self.assertEqual([message.subject for message in mail.outbox], ['Subject 1', 'Subject 2'])
+        self.assertEqual(self.redis.zcard(RETRY_KEY), 0)
+        dead = json.loads(self.redis.lindex(DEAD_LETTER_KEY, 0))
+        self.assertEqual((dead['subject'], dead['attempts']), ('Subject 0', MAIL_MAX_ATTEMPTS))
+
+    def test_failed_message_waits_for_its_retry_interval(self):
+        self.queue(1)
+        with patch.object(locmem.EmailBackend, 'send_messages', autospec=True,
+                          side_effect=smtplib.SMTPDataError(554, b'Message rejected')), \
+                self.assertLogs('users.emails', 'WARNING'), self.assertRaises(MailDeliveryError):
+            send_queued_emails()
+
+        # A new email is sent at once; the failed one is not due yet
+        self.queue(1)
+        self.assertEqual(send_queued_emails(), 1)
+        self.assertEqual(self.redis.zcard(RETRY_KEY), 1)
+
+        with patch('users.emails.time') as clock:
+            clock.time.return_value = time.time() + MAIL_RETRY_INTERVALS[0]
+            self.assertEqual(send_queued_emails(), 1)
+        self.assertEqual(self.redis.zcard(RETRY_KEY), 0)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_refused_recipients_go_to_the_dead_letter_list(self):
+        self.queue(2)
+        send = locmem.EmailBackend.send_messages
+
+        def refuse_first(backend, messages):
+            if messages[0].subject == 'Subject 0':
+                raise smtplib.SMTPRecipientsRefused({'someone@example.com': (550, b'No such user')})
+            return send(backend, messages)
+
+        with patch.object(locmem.EmailBackend, 'send_messages', autospec=True, side_effect=refuse_first), \
+                self.assertLogs('users.emails', 'ERROR'):
+            self.assertEqual(send_queued_emails(), 1)
+        self.assertEqual(self.redis.llen(DEAD_LETTER_KEY), 1)
+
+    def test_messages_of_a_killed_run_are_sent_first(self):
+        self.queue(2)
+        self.redis.lmove(OUTBOX_KEY, PROCESSING_KEY, 'LEFT', 'RIGHT')
+        self.assertEqual(send_queued_emails(), 2)
+        self.assertEqual([message.subject for message in mail.outbox], ['Subject 0', 'Subject 1'])
+        self.assertEqual(self.redis.llen(PROCESSING_KEY), 0)
+
+        self.queue(1)
+        self.redis.lmove(OUTBOX_KEY, PROCESSING_KEY, 'LEFT', 'RIGHT')
+        self.assertEqual(send_queued_emails(), 1)
+
+    def test_only_one_run_sends_at_a_time(self):
+        self.queue(1)
+        cache.add(MAIL_LOCK_KEY, 1)
+        self.assertEqual(send_queued_emails(), 0)
+        self.assertEqual(mail.outbox, [])
+
 class CheckUsernameViewTest(TestCase):
 
     def setUp(self):
@@ -91,9 +244,11 @@ class UserLoginViewTest(TestCase):
         self.assertIn('Invalid credentials.', response.json()['detail'])
 
 
-class UserFavoritesByIdViewTest(TestCase):
+class UserFavoritesByIdViewTest(MediaRootTestCase):
 
     def setUp(self):
+        super().setUp()
+        cache.clear()
         self.client = Client()
         self.user = User.objects.create_user(username='testuser', password='testpassword')
         video_file = SimpleUploadedFile('test_video.mp4', b'test video content')
@@ -108,3 +263,231 @@ class UserFavoritesByIdViewTest(TestCase):
         self.assertEqual(len(response.json()), 2)
         self.assertIn(self.video1.id, response.json())
         self.assertIn(self.video2.id, response.json())
+
+    async def test_get_favorites_of_unknown_user(self):
+        response = await self.async_client.get(reverse('user-favorites-by-id', args=[self.user.id + 1]))
+        self.assertEqual(response.status_code, 404)
+
+
+class FavoriteToggleTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='toggleuser', password='testpassword')
+        self.video = Video.objects.create(title='Toggle Video', description='A toggle video.')
+        self.url = reverse('favorite-toggle', args=[self.video.id])
+
+    def test_toggle_adds_then_removes(self):
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url, {'user_id': self.user.id}, content_type='application/json')
+        self.assertEqual(response.json()['message'], 'Video added to favorites.')
+        self.assertTrue(self.user.favorite_videos.filter(id=self.video.id).exists())
+
+        with self.assertNumQueries(4):
+            response = self.client.post(self.url, {'user_id': self.user.id}, content_type='application/json')
+        self.assertEqual(response.json()['message'], 'Video removed from favorites.')
+        self.assertFalse(self.user.favorite_videos.exists())
+
+    def test_toggle_unknown_user_or_video(self):
+        response = self.client.post(self.url, {'user_id': self.user.id + 1}, content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+        url = reverse('favorite-toggle', args=[self.video.id + 1])
+        response = self.client.post(url, {'user_id': self.user.id}, content_type='application/json')
+        self.assertEqual(response.json()['error'], 'Video not found.')
+
+
+class FavoriteBulkViewTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='bulkuser', password='testpassword')
+        self.videos = [Video.objects.create(title=f'Bulk Video {i}', description='') for i in range(3)]
+        self.user.favorite_videos.add(self.videos[0])
+        self.url = reverse('favorite-bulk')
+
+    def test_bulk_applies_all_operations(self):
+        operations = [
+            {'video_id': self.videos[0].id, 'action': 'remove'},
+            {'video_id': self.videos[1].id, 'action': 'add'},
+            {'video_id': self.videos[2].id, 'action': 'add'},
+            {'video_id': self.videos[2].id, 'action': 'remove'},
+            {'video_id': self.videos[2].id, 'action': 'add'},
+            {'video_id': 9999, 'action': 'add'},
+        ]
+        response = self.client.post(self.url, {'user_id': self.user.id, 'operations': operations},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'added': [self.videos[1].id, self.videos[2].id],
+                                           'removed': [self.videos[0].id]})
+        self.assertEqual(set(self.user.favorite_videos.values_list('id', flat=True)),
+                         {self.videos[1].id, self.videos[2].id})
+
+    def test_bulk_rejects_invalid_operations(self):
+        response = self.client.post(self.url, {'user_id': self.user.id, 'operations': [{'video_id': 1, 'action': 'like'}]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(self.url, {'user_id': self.user.id + 1, 'operations': [{'video_id': 1, 'action': 'add'}]},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+
+class FavoritesCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='cacheuser', password='testpassword')
+        self.videos = [Video.objects.create(title=f'Cached Video {i}', description='') for i in range(2)]
+        self.user.favorite_videos.add(self.videos[0])
+        self.url = reverse('user-favorites-by-id', args=[self.user.id])
+
+    def test_favorites_are_read_from_redis_after_first_load(self):
+        self.assertEqual(self.client.get(self.url).json(), [self.videos[0].id])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(self.url).json(), [self.videos[0].id])
+            response = self.client.get(self.url, {'video_id': self.videos[1].id})
+        self.assertEqual(response.json(), {'favorite': False})
+
+    def test_toggle_writes_through(self):
+        self.assertEqual(get_favorite_ids(self.user.id), {self.videos[0].id})
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_favorite(self.user.id, self.videos[1].id)
+            toggle_favorite(self.user.id, self.videos[0].id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_favorite_ids(self.user.id), {self.videos[1].id})
+
+    def test_write_through_without_cached_set_is_not_trusted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_favorite(self.user.id, self.videos[1].id)
+        with self.assertNumQueries(2):
+            self.assertEqual(get_favorite_ids(self.user.id), {self.videos[0].id, self.videos[1].id})
+
+    def test_changes_through_the_relation_drop_the_cached_set(self):
+        get_favorite_ids(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.favorite_videos.add(self.videos[1])
+        self.assertEqual(get_favorite_ids(self.user.id), {self.videos[0].id, self.videos[1].id})
+        with patch('content.signals.django_rq.get_queue'), self.captureOnCommitCallbacks(execute=True):
+            self.videos[0].delete()
+        self.assertEqual(get_favorite_ids(self.user.id), {self.videos[1].id})
+
+
+    def test_write_through_during_a_rebuild_is_not_lost(self):
+        read = favorites._read_favorites
+
+        def read_then_remove(user_id):
+            snapshot = read(user_id)
+            if read_then_remove.first:
+                # A removal commits and is written through after the snapshot was taken
+                read_then_remove.first = False
+                with self.captureOnCommitCallbacks(execute=True):
+                    toggle_favorite(user_id, self.videos[0].id)
+            return snapshot
+        read_then_remove.first = True
+
+        with patch('users.favorites._read_favorites', side_effect=read_then_remove) as read_favorites:
+            load_favorites(self.user.id)
+        self.assertEqual(read_favorites.call_count, 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_favorite_ids(self.user.id), set())
+
+
+class UserFavoriteVideosViewTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='hydrateduser', password='testpassword')
+        self.videos = [Video.objects.create(title=f'Hydrated Video {i}', description='') for i in range(5)]
+        self.user.favorite_videos.add(*self.videos[:4])
+        self.url = reverse('user-favorite-videos', args=[self.user.id])
+
+    def titles(self, response):
+        return [video['title'] for video in response.json()['results']]
+
+    def test_cold_page_costs_a_fixed_number_of_queries(self):
+        get_favorite_ids(self.user.id)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(self.titles(response), [f'Hydrated Video {i}' for i in (3, 2, 1, 0)])
+        self.assertIn('renditions', response.json()['results'][0])
+
+    def test_warm_pages_need_no_query(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {'page_size': 3})
+            self.assertEqual(self.titles(response), [f'Hydrated Video {i}' for i in (3, 2, 1)])
+            response = self.client.get(response.json()['next'])
+        self.assertEqual(self.titles(response), ['Hydrated Video 0'])
+        self.assertIsNone(response.json()['next'])
+
+    def test_invalid_page_size_and_unknown_user(self):
+        self.assertEqual(self.client.get(self.url, {'page_size': 0}).status_code, 400)
+        url = reverse('user-favorite-videos', args=[self.user.id + 1])
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class PopularityTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.users = [User.objects.create_user(username=f'popular{i}', password='testpassword') for i in range(3)]
+        self.videos = [Video.objects.create(title=f'Popular Video {i}', description='') for i in range(3)]
+
+    def favorite(self, user, video):
+        with self.captureOnCommitCallbacks(execute=True):
+            toggle_favorite(user.id, video.id)
+
+    def test_toggles_maintain_counts_and_ranking(self):
+        for user in self.users:
+            self.favorite(user, self.videos[1])
+        self.favorite(self.users[0], self.videos[2])
+        load_popularity()
+        self.favorite(self.users[1], self.videos[2])
+        self.favorite(self.users[2], self.videos[2])
+        self.favorite(self.users[0], self.videos[1])
+
+        self.videos[1].refresh_from_db()
+        self.assertEqual(self.videos[1].favorite_count, 2)
+        self.client.get(reverse('favorites-popular'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('favorites-popular'), {'limit': 5})
+        ranking = [(entry['video']['title'], entry['favorite_count']) for entry in response.json()]
+        self.assertEqual(ranking, [('Popular Video 2', 3), ('Popular Video 1', 2)])
+        self.assertNotIn('favorite_count', response.json()[0]['video'])
+
+    def test_deleted_video_leaves_the_ranking(self):
+        self.favorite(self.users[0], self.videos[0])
+        self.favorite(self.users[0], self.videos[1])
+        load_popularity()
+        with patch('content.signals.django_rq.get_queue'), self.captureOnCommitCallbacks(execute=True):
+            self.videos[0].delete()
+        self.client.get(reverse('favorites-popular'))
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('favorites-popular'))
+        self.assertEqual([entry['video']['title'] for entry in response.json()], ['Popular Video 1'])
+
+    def test_only_changed_rows_are_counted(self):
+        self.users[0].favorite_videos.add(self.videos[0])
+        Video.objects.filter(id=self.videos[0].id).update(favorite_count=1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(apply_favorites(self.users[0].id, [(ADD, self.videos[0].id), (REMOVE, self.videos[1].id)]),
+                             {'added': [], 'removed': []})
+        self.assertEqual(dict(Video.objects.values_list('title', 'favorite_count')),
+                         {'Popular Video 0': 1, 'Popular Video 1': 0, 'Popular Video 2': 0})
+
+    @patch('users.favorites._insert_favorites', return_value=[])
+    def test_insert_lost_to_a_concurrent_toggle_is_not_counted(self, insert):
+        self.assertTrue(toggle_favorite(self.users[0].id, self.videos[0].id))
+        self.videos[0].refresh_from_db()
+        self.assertEqual(self.videos[0].favorite_count, 0)
+
+    def test_missing_ranking_is_rebuilt_from_the_column(self):
+        Video.objects.filter(id=self.videos[0].id).update(favorite_count=4)
+        response = self.client.get(reverse('favorites-popular'))
+        self.assertEqual([entry['favorite_count'] for entry in response.json()], [4])
+
+    def test_reconcile_fixes_drift(self):
+        self.users[0].favorite_videos.add(self.videos[0], self.videos[1])
+        Video.objects.filter(id=self.videos[2].id).update(favorite_count=7)
+        self.assertEqual(reconcile_favorite_counts(), 3)
+        counts = dict(Video.objects.values_list('title', 'favorite_count'))
+        self.assertEqual(counts, {'Popular Video 0': 1, 'Popular Video 1': 1, 'Popular Video 2': 0})
+        response = self.client.get(reverse('favorites-popular'))
+        self.assertEqual(len(response.json()), 2)
@@ -1,5 +1,5 @@
 from django.conf import settings
-from django.http import HttpResponseBadRequest, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.shortcuts import render, redirect
 from django.views import View
 from rest_framework.views import APIView
@@ -7,16 +7,20 @@ from rest_framework.response import Response
 from rest_framework import status
 from django.contrib.auth import get_user_model
 
+from content.fragments import aget_fragments_by_id, dumps, join_fragments
 from content.models import Video
+from content.pagination import CATALOG_MAX_PAGE_SIZE, CATALOG_PAGE_SIZE
 from content.serializers import VideoSerializer
 from users.models import CustomUser
-from .serializers import SetNewPasswordSerializer, UserRegistrationSerializer
+from .emails import queue_email
+from .favorites import (POPULARITY_MAX_LIMIT, aget_favorite_ids, aget_popular, ais_favorite, apply_favorites,
+                        toggle_favorite)
+from .serializers import FavoriteBulkSerializer, SetNewPasswordSerializer, UserRegistrationSerializer
 from rest_framework.permissions import AllowAny
 from django.urls import reverse
 from django.template.loader import render_to_string
-from django.core.mail import send_mail
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import urlencode, urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import force_bytes, force_str  # force_str anstelle von force_text
 from django.contrib.auth import authenticate, login
 User = get_user_model()
@@ -95,26 +99,24 @@ class UserRegistrationView(APIView):
             f"If you did not create this account, you can safely ignore this email."
         )
 
-        send_mail(
+        queue_email(
             'Activate Your Account',
             plain_message,  # Text-Inhalt als Fallback
-            settings.DEFAULT_FROM_EMAIL,
             [user.username],  # E-Mail-Adresse des Benutzers
-            fail_silently=False,
             html_message=html_message  # HTML-Inhalt
         )
 
 
-class CheckUsernameView(APIView):
+class CheckUsernameView(View):
     """
-    Checks if the username is already axist
+    Checks if the username is already axist.
+    Async, so the lookup does not hold a worker thread under ASGI.
     """
-    permission_classes = [AllowAny]
-    def get(self, request, username):
+    async def get(self, request, username):
         username = username.lower()
-        if User.objects.filter(username__iexact=username).exists():
-            return Response({"exists": True, "message": "Username is already taken."}, status=status.HTTP_200_OK)
-        return Response({"exists": False, "message": "Username is available."}, status=status.HTTP_200_OK)
+        if await User.objects.filter(username__iexact=username).aexists():
+            return JsonResponse({"exists": True, "message": "Username is already taken."}, status=status.HTTP_200_OK)
+        return JsonResponse({"exists": False, "message": "Username is available."}, status=status.HTTP_200_OK)
 
 class ActivateAccountView(APIView):
     """
@@ -203,8 +205,7 @@ class ResendActivationLinkView(APIView):
             html_message = render_to_string('activation_email.html', {'activation_link': activation_link, 'user': user})
             plain_message = (f"Hi {user.username},\n\nThank you for registering with us. To activate your account, "
                              f"please click the link below:\n{activation_link}\n\nIf you did not create this account, you can safely ignore this email.")
-            send_mail('Activate Your Account', plain_message, settings.DEFAULT_FROM_EMAIL, [user.username], 
-                      fail_silently=False, html_message=html_message)
+            queue_email('Activate Your Account', plain_message, [user.username], html_message=html_message)
             return Response({"message": "Activation link resent successfully. Check your email."}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
@@ -221,62 +222,117 @@ class FavoriteVideoToggle(APIView):
         """
         Handles adding or removing a video from user's favorites.
         """
-        user = self._get_user(request.data.get('user_id'))
-        if isinstance(user, Response):
-            return user
-
-        video = self._get_video(video_id)
-        if isinstance(video, Response):
-            return video
-
-        return self._toggle_favorite(user, video)
-
-    def _get_user(self, user_id):
-        """
-        Retrieve a user by ID.
-        """
+        user_id = request.data.get('user_id')
         if not user_id:
             return Response({"error": "User ID is required."}, status=status.HTTP_400_BAD_REQUEST)
-        
+
         try:
-            return User.objects.get(id=user_id)
+            added = toggle_favorite(user_id, video_id)
         except User.DoesNotExist:
             return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-
-    def _get_video(self, video_id):
-        """
-        Retrieve a video by ID.
-        """
-        try:
-            return Video.objects.get(id=video_id)
         except Video.DoesNotExist:
             return Response({"error": "Video not found."}, status=status.HTTP_404_NOT_FOUND)
 
-    def _toggle_favorite(self, user, video):
-        """
-        Toggle the favorite status of a video for a user.
-        """
-        if video in user.favorite_videos.all():
-            user.favorite_videos.remove(video)
-            return Response({"message": "Video removed from favorites."}, status=status.HTTP_200_OK)
-        else:
-            user.favorite_videos.add(video)
+        if added:
             return Response({"message": "Video added to favorites."}, status=status.HTTP_200_OK)
+        return Response({"message": "Video removed from favorites."}, status=status.HTTP_200_OK)
 
-        
 
-class UserFavoritesByIdView(APIView):
-    def get(self, request, user_id):
+class FavoriteBulkView(APIView):
+    """
+    Applies many favorite additions and removals of one user in one request.
+
+    Expects ``{"user_id": 1, "operations": [{"video_id": 3, "action": "add"}, ...]}``
+    and answers with the ids that were added and removed.
+    """
+
+    def post(self, request):
+        serializer = FavoriteBulkSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer.validated_data
+        operations = [(operation['action'], operation['video_id']) for operation in data['operations']]
         try:
-            user = CustomUser.objects.get(id=user_id)
-        except CustomUser.DoesNotExist:
+            result = apply_favorites(data['user_id'], operations)
+        except User.DoesNotExist:
             return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        return Response(result, status=status.HTTP_200_OK)
 
-        favorite_videos = user.favorite_videos.all()  # Abrufen der favorisierten Videos
-        video_ids = favorite_videos.values_list('id', flat=True)  # Nur die IDs extrahieren
-        return Response(video_ids, status=status.HTTP_200_OK)
+        
+
+class UserFavoritesByIdView(View):
+    """
+    Returns the ids of the videos a user marked as favorite, or with
+    ``?video_id=`` whether that one video is a favorite.
+
+    Favorites are mirrored in a Redis set per user, so a read is one
+    SMEMBERS (or SMISMEMBER) without a database query. Async, so it does
+    not hold a worker thread under ASGI.
+    """
+    async def get(self, request, user_id):
+        video_id = request.GET.get('video_id')
+        try:
+            if video_id:
+                if not video_id.isdigit():
+                    return JsonResponse({"error": "Invalid video ID."}, status=status.HTTP_400_BAD_REQUEST)
+                return JsonResponse({"favorite": await ais_favorite(user_id, int(video_id))}, status=status.HTTP_200_OK)
+            video_ids = await aget_favorite_ids(user_id)
+        except CustomUser.DoesNotExist:
+            return JsonResponse({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        return JsonResponse(sorted(video_ids), safe=False, status=status.HTTP_200_OK)
     
 
+class UserFavoriteVideosView(View):
+    """
+    Returns a user's favorite videos fully serialized, newest first, one
+    page at a time (``?page_size=``, ``?cursor=`` taken from ``next``).
+
+    The ids come from the cached favorites set and the videos from the
+    cached per-video JSON fragments with one MGET, so a page costs no
+    query once both are warm and at most two (videos and renditions)
+    otherwise, independent of the page size.
+    """
+    async def get(self, request, user_id):
+        cursor = request.GET.get('cursor', '')
+        page_size = request.GET.get('page_size', str(CATALOG_PAGE_SIZE))
+        valid_page_size = page_size.isdigit() and 1 <= int(page_size) <= CATALOG_MAX_PAGE_SIZE
+        if (cursor and not cursor.isdigit()) or not valid_page_size:
+            return JsonResponse({"error": "Invalid cursor or page size."}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = int(page_size)
+        try:
+            video_ids = sorted(await aget_favorite_ids(user_id), reverse=True)
+        except CustomUser.DoesNotExist:
+            return JsonResponse({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        if cursor:
+            video_ids = [video_id for video_id in video_ids if video_id < int(cursor)]
+        page = video_ids[:page_size]
+        next_url = None
+        if len(video_ids) > page_size:
+            next_url = f"{request.path}?{urlencode({'cursor': page[-1], 'page_size': page_size})}"
+        fragments = await aget_fragments_by_id(page)
+        payload = b'{"next":' + dumps(next_url) + b',"results":' + join_fragments(fragments.values()) + b'}'
+        return HttpResponse(payload, content_type='application/json')
+
+
+class PopularVideosView(View):
+    """
+    Returns the most favorited videos (``?limit=``, default 10) with their
+    favorite counts, read from a Redis sorted set that every toggle updates.
+    """
+    async def get(self, request):
+        limit = request.GET.get('limit', '10')
+        if not limit.isdigit() or not 1 <= int(limit) <= POPULARITY_MAX_LIMIT:
+            return JsonResponse({"error": f"Limit must be between 1 and {POPULARITY_MAX_LIMIT}."},
+                                status=status.HTTP_400_BAD_REQUEST)
+        ranking = await aget_popular(int(limit))
+        fragments = await aget_fragments_by_id([video_id for video_id, _ in ranking])
+        payload = join_fragments([b'{"favorite_count":%d,"video":%s}' % (count, fragments[video_id])
+                                  for video_id, count in ranking if video_id in fragments])
+        return HttpResponse(payload, content_type='application/json')
+
+
 class PasswordResetRequestView(APIView):
     """
     Sends an email with a link to reset the password.
@@ -310,12 +366,10 @@ class PasswordResetRequestView(APIView):
             f"{reset_link}\n\n"
             f"If you did not request this, please ignore this email."
         )
-        send_mail(
+        queue_email(
             'Password Reset Request',
             plain_message,
-            settings.DEFAULT_FROM_EMAIL,
             [user.email],
-            fail_silently=False,
             html_message=html_message
         )
 
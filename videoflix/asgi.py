@@ -2,6 +2,8 @@
 ASGI config for videoflix project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it with an ASGI server so the async catalog and favorites views run on
+the event loop, e.g. ``gunicorn videoflix.asgi:application -k uvicorn.workers.UvicornWorker``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.0/howto/deployment/asgi/
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
 import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -161,6 +162,26 @@ AUTHENTICATION_BACKENDS = [
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+#Hand media transfers to the front proxy: None, 'x-accel-redirect' (nginx) or 'x-sendfile'
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+#Media URLs are HMAC-signed and expire when a key is set (see content.signing); the front proxy needs the same key
+MEDIA_URL_SIGNING_KEY = os.environ.get('MEDIA_URL_SIGNING_KEY')
+MEDIA_URL_TTL = 60 * 60
+MEDIA_URL_BUCKET = 60 * 60
+
+STORAGES = {
+    'default': {'BACKEND': 'content.storage.SignedMediaStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+#Uploads are hashed while they stream in (see content.signals.video_pre_save)
+FILE_UPLOAD_HANDLERS = [
+    'content.uploadhandlers.HashingMemoryFileUploadHandler',
+    'content.uploadhandlers.HashingTemporaryFileUploadHandler',
+]
+
 CACHES = { 
  "default": { 
      "BACKEND": "django_redis.cache.RedisCache",
@@ -179,7 +200,17 @@ INTERNAL_IPS = [
     # ...
 ]
 
-CACHE_TTL = 60 * 15
+#Cached catalog lists are keyed by catalog version; old versions expire after this
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+#Videos per page of /videos/ and the largest page a client may ask for
+CATALOG_PAGE_SIZE = 24
+CATALOG_MAX_PAGE_SIZE = 100
+#Videos per category row of /videos/browse/
+CATALOG_BROWSE_ROW_SIZE = 12
+#While a new catalog version is rendered, readers get the previous list for this many seconds
+CATALOG_STALE_WHILE_REVALIDATE = 60
+#If rendering fails, the previous list is served for this many seconds instead of an error
+CATALOG_STALE_IF_ERROR = 60 * 60 * 24
 
 
 RQ_QUEUES = {
@@ -190,8 +221,47 @@ RQ_QUEUES = {
         'DEFAULT_TIMEOUT': 360,
        
     },
+    'email': {
+        'HOST': 'localhost',
+        'PORT': 6379,
+        'DB': 0,
+        'DEFAULT_TIMEOUT': 360,
+    },
 }
 
+#Tests clear the cache, so they run against Redis databases of their own and never touch the development data
+TESTING = sys.argv[1:2] == ['test']
+if TESTING:
+    CACHES['default']['LOCATION'] = 'redis://127.0.0.1:6379/15'
+    for queue in RQ_QUEUES.values():
+        queue['DB'] = 14
+
+#Emails are sent by a worker on this queue (rqworker email --with-scheduler), up to MAIL_BATCH_SIZE per connection
+MAIL_QUEUE = 'email'
+MAIL_BATCH_SIZE = 50
+#Seconds between the retries of a failed send
+MAIL_RETRY_INTERVALS = [10, 60, 300, 900]
+#A message that failed this often is moved to the dead-letter list (videoflix:mail:dead)
+MAIL_MAX_ATTEMPTS = 5
+#Seconds a send job may run before RQ kills it
+MAIL_JOB_TIMEOUT = 360
+
+#FFmpeg
+FFMPEG_BIN = r'C:\Dev\tools\ffmpeg\ffmpeg-master-latest-win64-gpl\ffmpeg-master-latest-win64-gpl\bin\ffmpeg'
+FFPROBE_BIN = r'C:\Dev\tools\ffmpeg\ffmpeg-master-latest-win64-gpl\ffmpeg-master-latest-win64-gpl\bin\ffprobe'
+
+#Encoding profiles new uploads are converted with (see content.profiles)
+VIDEO_PROFILES = ['480p', '720p']
+
+#Segmented output written next to the MP4 renditions ('hls', 'dash')
+VIDEO_STREAMING_FORMATS = ['hls']
+VIDEO_SEGMENT_SECONDS = 6
+
+#Uploads longer than two chunks are split on keyframes and converted in parallel jobs
+VIDEO_CHUNK_SECONDS = 60
+#Seconds after which a video left encoding by a killed worker can be claimed again; keep it above the job timeout
+VIDEO_CLAIM_LEASE = 60 * 60
+
 
 #Import/Export
 IMPORT_EXPORT_USE_TRANSACTIONS = True
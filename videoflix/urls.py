@@ -16,10 +16,9 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import include, path
-from content.views import VideoListView
-from users.views import ActivateAccountView, CheckUsernameView, FavoriteVideoToggle, PasswordResetConfirmView, PasswordResetRequestView, UserFavoritesByIdView,  UserLoginView, UserRegistrationView, ResendActivationLinkView
+from content.views import MediaFileView, ResumableUploadDetailView, ResumableUploadView, VideoBrowseView, VideoListView, VideoProgressView
+from users.views import ActivateAccountView, CheckUsernameView, FavoriteBulkView, FavoriteVideoToggle, PasswordResetConfirmView, PasswordResetRequestView, UserFavoritesByIdView,  UserLoginView, UserRegistrationView, ResendActivationLinkView, UserFavoriteVideosView, PopularVideosView
 from django.conf import settings
-from django.conf.urls.static import static
 from debug_toolbar.toolbar import debug_toolbar_urls
 
 urlpatterns = [
@@ -30,9 +29,17 @@ urlpatterns = [
     path('login/', UserLoginView.as_view(), name='login'),
     path('resend-activation/', ResendActivationLinkView.as_view(), name='resend-activation'),
     path('videos/', VideoListView.as_view(), name='video-list'),
+    path('videos/browse/', VideoBrowseView.as_view(), name='video-browse'),
+    path('videos/<int:video_id>/progress/', VideoProgressView.as_view(), name='video-progress'),
+    path('uploads/', ResumableUploadView.as_view(), name='upload-create'),
+    path('uploads/<uuid:upload_id>/', ResumableUploadDetailView.as_view(), name='upload-detail'),
     path('django-rq/', include('django_rq.urls')),
     path('favorites/toggle/<int:video_id>/', FavoriteVideoToggle.as_view(), name='favorite-toggle'),
+    path('favorites/bulk/', FavoriteBulkView.as_view(), name='favorite-bulk'),
     path('favorites/user/<int:user_id>/', UserFavoritesByIdView.as_view(), name='user-favorites-by-id'),
+    path('favorites/popular/', PopularVideosView.as_view(), name='favorites-popular'),
+    path('favorites/user/<int:user_id>/videos/', UserFavoriteVideosView.as_view(), name='user-favorite-videos'),
     path('password-reset/', PasswordResetRequestView.as_view(), name='password_reset_request'),
     path('reset/<uidb64>/<token>/', PasswordResetConfirmView.as_view(), name='password_reset_confirm'),
-]  + static(settings.MEDIA_URL, document_root = settings.MEDIA_ROOT) + debug_toolbar_urls()
+    path(f"{settings.MEDIA_URL.strip('/')}/<path:path>", MediaFileView.as_view(), name='media'),
+] + debug_toolbar_urls()